@@ -1,18 +1,84 @@
 import math, random, time
+from array import array
 
 from Chess import openings_dictionary
 from Chess.Board import pieces
-from Chess.Board.move_generator import MoveGenerator
+from Chess.Board.move_generator import MoveGenerator, MoveBuffers, MAX_PLY, LOSING_CAPTURE_SCORE, HISTORY_COLOR_OFFSET, HISTORY_SIZE, pick_move
+from Chess.Board.legal_move_cache import LegalMoveCache
+from Chess.Board.move import START_POSITION_SHIFT, CAPTURE_MASK, EN_PASSANT_FLAG, PROMOTION_MASK, get_start_position, get_end_position, is_capture
+from Chess.Board.bitops import SQUARE_BB, popcount, bitboard_to_bitboard_positions
 
 from Chess.AI.pre_computed_data import *
+from Chess.AI.transposition_table import TranspositionTable, EXACT_BOUND, LOWER_BOUND, UPPER_BOUND
+
+# With no clock the bot thinks for a fixed time
+DEFAULT_SEARCH_TIME = 2
+# Share of the remaining time for one move, and how far past it the iteration in progress may run
+MOVES_TO_GO = 30
+HARD_TIME_FACTOR = 4
+INCREMENT_SHARE = 0.75
+TIME_MARGIN = 1
+MAX_SEARCH_DEPTH = MAX_PLY // 2
+# History is halved when a score passes this and between moves, so recent cutoffs count the most
+HISTORY_MAX = 1 << 20
+
+class SearchTimeout(Exception):
+    pass
+
+class MoveOrdering:
+    # What beta cutoffs taught search about quiet moves: two killer moves per ply, a history score by color, start and
+    # end position, and the countermove that refuted each previous move by its start and end position
+    def __init__(self, max_ply = MAX_PLY):
+        self.killers = [[0, 0] for _ in range(max_ply)]
+        self.history = array('i', [0]) * HISTORY_SIZE
+        self.countermoves = array('I', [0]) * HISTORY_COLOR_OFFSET
+        # The move search is trying at each ply, the previous move of the ply after it
+        self.ply_moves = array('I', [0]) * max_ply
+
+    def get_killers(self, ply):
+        killers = self.killers[ply]
+        countermove = self.countermoves[self.ply_moves[ply-1] >> START_POSITION_SHIFT] if ply > 0 else 0
+        return killers[0], killers[1], countermove
+
+    def update(self, move, ply, depth, white_to_move):
+        # Captures and promotions are already ordered first
+        if move & (CAPTURE_MASK | EN_PASSANT_FLAG | PROMOTION_MASK):
+            return
+
+        killers = self.killers[ply]
+        if killers[0] != move:
+            killers[1] = killers[0]
+            killers[0] = move
+
+        index = (HISTORY_COLOR_OFFSET if white_to_move else 0) | move >> START_POSITION_SHIFT
+        self.history[index] += depth * depth
+        if self.history[index] > HISTORY_MAX:
+            self.age_history()
+
+        if ply > 0:
+            self.countermoves[self.ply_moves[ply-1] >> START_POSITION_SHIFT] = move
+
+    def new_search(self):
+        for killers in self.killers:
+            killers[0] = killers[1] = 0
+        self.age_history()
+
+    def age_history(self):
+        for index in range(HISTORY_SIZE):
+            self.history[index] >>= 1
 
 class ChessBot:
-    def __init__(self, board):
+    def __init__(self, board, legal_move_cache = None, transposition_table = None):
         self.board = board
+        self.legal_move_cache = legal_move_cache if legal_move_cache is not None else LegalMoveCache(board)
+        # Kept from move to move, most of the tree searched for one move is searched again for the next
+        self.transposition_table = transposition_table if transposition_table is not None else TranspositionTable()
         self.is_opening_theory = True
         self.current_line = openings_dictionary.openings
+        self.move_buffers = MoveBuffers()
+        self.move_ordering = MoveOrdering()
     
-    def find_move(self):
+    def find_move(self, timer = None):
         move, evaluation = None, 0
 
         if self.is_opening_theory:
@@ -20,19 +86,47 @@ class ChessBot:
             evaluation = 0
         
         if move is None:
-            start_time = time.perf_counter()
-            transposition_table = {}
-            depth = 3
-            evaluation, move, positions_searched = search(self.board, depth, -1_000_000_000, 1_000_000_000, transposition_table)
-            print(f"Depth: {depth}, Eval: {evaluation}, Positions Searched: {positions_searched}, Time Taken: {round(time.perf_counter() - start_time, 1)}")
+            move, evaluation = self.iterative_deepening(*get_time_budget(timer))
 
         if move is None:
-            move_generator = MoveGenerator(self.board)
-            move = move_generator.get_legal_moves()[0]
+            move = self.legal_move_cache.get_legal_moves()[0]
             evaluation = evaluate(self.board)
         
         return move, evaluation
     
+    def iterative_deepening(self, soft_time, hard_time):
+        # Searches depth 1, 2, 3... sharing the transposition table, so each iteration starts from the best move of
+        # the one before. No new iteration starts after soft_time, and the one in progress is dropped at hard_time.
+        # Depth 1 always finishes, so there is a completed result to play
+        start_time = time.perf_counter()
+        hard_deadline = start_time + hard_time
+        transposition_table = self.transposition_table
+        transposition_table.new_search()
+        self.move_ordering.new_search()
+        move, evaluation, depth, positions_searched = None, 0, 0, 0
+
+        if len(self.legal_move_cache.get_legal_moves()) == 1:
+            return self.legal_move_cache.get_legal_moves()[0], evaluate(self.board)
+
+        while depth < MAX_SEARCH_DEPTH:
+            deadline = math.inf if depth == 0 else hard_deadline
+            try:
+                iteration_evaluation, iteration_move, iteration_positions = search(self.board, depth+1, -1_000_000_000, 1_000_000_000, transposition_table, self.move_buffers, self.move_ordering, 0, deadline)
+            except SearchTimeout:
+                break
+
+            depth += 1
+            positions_searched += iteration_positions
+            if iteration_move is not None:
+                move, evaluation = iteration_move, iteration_evaluation
+
+            # A forced mate won't change with more depth
+            if abs(evaluation) >= 1_000_000_000 or time.perf_counter() - start_time >= soft_time:
+                break
+
+        print(f"Depth: {depth}, Eval: {evaluation}, Positions Searched: {positions_searched}, Time Taken: {round(time.perf_counter() - start_time, 1)}")
+        return move, evaluation
+
     def get_book_move(self):
         if len(self.board.moves) > 0:
             previous_move_square = move_to_square(self.board.moves[-1], self.board)
@@ -49,102 +143,144 @@ class ChessBot:
             end_square = random.choice(list(self.current_line.keys()))
             self.current_line = self.current_line[end_square]
 
-        return square_to_move(end_square, self.board)
+        return square_to_move(end_square, self.board, self.legal_move_cache)
+
 
+def get_time_budget(timer):
+    # Soft and hard limits in seconds for one move, from the time left on the bot's clock and its increment
+    if timer is None:
+        return DEFAULT_SEARCH_TIME, DEFAULT_SEARCH_TIME
+    remaining_time = max(timer.time - TIME_MARGIN, 0)
+    soft_time = remaining_time / MOVES_TO_GO + timer.increment * INCREMENT_SHARE
+    hard_time = max(soft_time, min(soft_time * HARD_TIME_FACTOR, remaining_time / 2))
+    return soft_time, hard_time
 
-def search(board, depth, alpha, beta, transposition_table):
-    if board.previous_positions.count(board.zobrist_key) >= 3:
+def search(board, depth, alpha, beta, transposition_table, move_buffers, move_ordering, ply, deadline = math.inf):
+    if time.perf_counter() >= deadline:
+        raise SearchTimeout
+
+    if board.is_threefold_repetition:
         return 0, None, 1
 
-    shallow_best_move = None
-    if board.zobrist_key in transposition_table:
-        if transposition_table[board.zobrist_key][0] >= depth:
-            return transposition_table[board.zobrist_key][1], transposition_table[board.zobrist_key][2], 1
-        else:
-            shallow_best_move = transposition_table[board.zobrist_key][2]
+    # A deep enough entry settles the position if its bound does, otherwise its move is tried first.
+    # The root always searches so it has a move to return
+    hash_move = 0
+    entry = transposition_table.probe(board.zobrist_key)
+    if entry is not None:
+        entry_depth, bound, entry_evaluation, hash_move = entry
+        if ply > 0 and entry_depth >= depth and (bound == EXACT_BOUND or
+                (bound == LOWER_BOUND and entry_evaluation >= beta) or (bound == UPPER_BOUND and entry_evaluation <= alpha)):
+            return entry_evaluation, hash_move or None, 1
 
     if depth == 0:
-        return search_captures(board, alpha, beta, transposition_table)
+        return search_captures(board, alpha, beta, transposition_table, move_buffers, ply, deadline)
 
     move_generator = MoveGenerator(board)
-    legal_moves = move_generator.get_legal_moves()
-
-    if len(legal_moves) == 0:
-        if board.white_in_check or board.black_in_check:
-            return -1_000_000_000 * depth, None, 1
-        else:
-            return 0, None, 1
-
-    legal_moves.sort(key=lambda move: -1_000_000 if shallow_best_move is not None and move.start_bitboard_position & shallow_best_move.start_bitboard_position and move.end_bitboard_position & move.end_bitboard_position and not shallow_best_move.is_promotion else -move.capture_value)
 
     best_move = None
+    has_legal_move = False
 
     positions_searched = 0
 
-    for move in legal_moves:
+    # Moves come hash move first, then captures, killers and quiet moves by history, each stage only generated if nothing
+    # cut off before it. They are pseudo-legal, legality is only checked for the moves that are actually tried
+    staged_moves = move_generator.generate_staged_moves(move_buffers.moves[ply], move_buffers.scores[ply], hash_move,
+                                                        move_ordering.get_killers(ply), pseudo_legal = True, history = move_ordering.history)
+    for move in staged_moves:
+        if not board.is_legal(move):
+            continue
+        has_legal_move = True
+        move_ordering.ply_moves[ply] = move
         board.make_move(move)
-        move_evaluation, _, new_positions = search(board, depth-1, -beta, -alpha, transposition_table)
+        # A timeout unwinds the whole search, the board still has to be put back
+        try:
+            move_evaluation, _, new_positions = search(board, depth-1, -beta, -alpha, transposition_table, move_buffers, move_ordering, ply+1, deadline)
+        finally:
+            board.undo_move(move)
         move_evaluation *= -1
-        board.undo_move(move)
         positions_searched += new_positions
         if move_evaluation >= beta:
+            move_ordering.update(move, ply, depth, board.white_to_move)
+            transposition_table.store(board.zobrist_key, depth, LOWER_BOUND, beta, move)
             return beta, move, positions_searched
         if move_evaluation > alpha:
             best_move = move
             alpha = move_evaluation
+
+    if not has_legal_move:
+        if board.white_in_check or board.black_in_check:
+            return -1_000_000_000 * depth, None, 1
+        else:
+            return 0, None, 1
     
     if best_move != None:
-        transposition_table[board.zobrist_key] = (depth, alpha, best_move)
+        transposition_table.store(board.zobrist_key, depth, EXACT_BOUND, alpha, best_move)
+    else:
+        transposition_table.store(board.zobrist_key, depth, UPPER_BOUND, alpha)
 
     return alpha, best_move, positions_searched
 
-def search_captures(board, alpha, beta, transposition_table):
+def search_captures(board, alpha, beta, transposition_table, move_buffers, ply, deadline = math.inf):
+    if time.perf_counter() >= deadline:
+        raise SearchTimeout
+
     evaluation = evaluate(board)
     if (evaluation >= beta):
         return beta, None, 1
     alpha = max(alpha, evaluation)
 
-    move_generator = MoveGenerator(board)
-    legal_moves = move_generator.get_legal_moves()
-
-    if len(legal_moves) == 0:
-        if board.white_in_check or board.black_in_check:
-            return -1_000_000_000, None, 1
-        else:
-            return 0, None, 1
-    
-    legal_captures = [move for move in legal_moves if move.is_capture]
-
-    if len(legal_captures) == 0:
+    if ply >= MAX_PLY:
         return alpha, None, 1
-    
-    legal_captures.sort(key=lambda move: -move.capture_value)
 
-    best_move = legal_moves[0]
+    moves = move_buffers.moves[ply]
+    scores = move_buffers.scores[ply]
+    move_generator = MoveGenerator(board)
+    capture_count = move_generator.generate_legal_captures(moves, under_promotions = False, pseudo_legal = True)
+    move_generator.score_captures(moves, scores, capture_count)
+
+    best_move = None
+    has_legal_capture = False
 
     positions_searched = 0
 
-    for move in legal_captures:
+    for i in range(capture_count):
+        move = pick_move(moves, scores, i, capture_count)
+        # Captures come best first, from the first that loses material in the exchange on none are worth searching
+        if scores[i] <= LOSING_CAPTURE_SCORE:
+            break
+        if not board.is_legal(move):
+            continue
+        has_legal_capture = True
         board.make_move(move)
-        move_evaluation, _, new_positions = search_captures(board, -beta, -alpha, transposition_table)
+        try:
+            move_evaluation, _, new_positions = search_captures(board, -beta, -alpha, transposition_table, move_buffers, ply+1, deadline)
+        finally:
+            board.undo_move(move)
         move_evaluation *= -1
-        board.undo_move(move)
         positions_searched += new_positions
         if move_evaluation >= beta:
             return beta, move, positions_searched
         if move_evaluation > alpha:
             best_move = move
             alpha = move_evaluation
-    
+
+    if not has_legal_capture:
+        if not move_generator.has_legal_move():
+            if board.white_in_check or board.black_in_check:
+                return -1_000_000_000, None, 1
+            else:
+                return 0, None, 1
+        return alpha, None, 1
+
     return alpha, best_move, positions_searched
 
 def evaluate(board):
     evaluation = 0
 
-    white_pieces = board.bitboard_to_bitboard_positions(board.pieces[pieces.WHITE])
-    black_pieces = board.bitboard_to_bitboard_positions(board.pieces[pieces.BLACK])
-    white_piece_count = bin(board.pieces[pieces.WHITE] & (board.pieces[pieces.KNIGHT] | board.pieces[pieces.BISHOP] | board.pieces[pieces.ROOK] | board.pieces[pieces.QUEEN])).count('1')
-    black_piece_count = bin(board.pieces[pieces.BLACK] & (board.pieces[pieces.KNIGHT] | board.pieces[pieces.BISHOP] | board.pieces[pieces.ROOK] | board.pieces[pieces.QUEEN])).count('1')
+    white_pieces = bitboard_to_bitboard_positions(board.pieces[pieces.WHITE])
+    black_pieces = bitboard_to_bitboard_positions(board.pieces[pieces.BLACK])
+    white_piece_count = popcount(board.pieces[pieces.WHITE] & (board.pieces[pieces.KNIGHT] | board.pieces[pieces.BISHOP] | board.pieces[pieces.ROOK] | board.pieces[pieces.QUEEN]))
+    black_piece_count = popcount(board.pieces[pieces.BLACK] & (board.pieces[pieces.KNIGHT] | board.pieces[pieces.BISHOP] | board.pieces[pieces.ROOK] | board.pieces[pieces.QUEEN]))
 
     for piece in white_pieces:
         position, bitboard_position = piece[0], piece[1]
@@ -212,22 +348,20 @@ def get_piece_letter(piece_type):
     if piece_type == pieces.KING: return 'K'
 
 def move_to_square(move, board):
-    end_square = index_position_to_human_position(move.end_position)
-    piece_type = board.get_piece_type(2**move.end_position)
+    end_square = index_position_to_human_position(get_end_position(move))
+    piece_type = board.get_piece_type(SQUARE_BB[get_end_position(move)])
     capture_info = ''
-    if move.is_capture:
-        if board.is_pawn(2**move.end_position):
-            capture_info += index_position_to_human_position(move.start_position)[0]
+    if is_capture(move):
+        if board.is_pawn(SQUARE_BB[get_end_position(move)]):
+            capture_info += index_position_to_human_position(get_start_position(move))[0]
         capture_info += 'x'
     return get_piece_letter(piece_type) + capture_info + end_square
 
-def square_to_move(square, board):
+def square_to_move(square, board, legal_move_cache):
     end_bitboard_position = human_position_to_bitboard_position(square[-2] + square[-1])
-    move_generator = MoveGenerator(board)
-    legal_moves = move_generator.get_legal_moves()
-    for move in legal_moves:
-        if 2**move.end_position == end_bitboard_position:
-            piece_letter = get_piece_letter(board.get_piece_type(2**move.start_position))
+    for move in legal_move_cache.get_legal_moves():
+        if SQUARE_BB[get_end_position(move)] == end_bitboard_position:
+            piece_letter = get_piece_letter(board.get_piece_type(SQUARE_BB[get_start_position(move)]))
             if len(square) == 2 and piece_letter == '':
                 return move
             if square[0] == piece_letter:
@@ -0,0 +1,110 @@
+import mmap, struct
+from array import array
+
+DEFAULT_SIZE_MB = 16
+
+EXACT_BOUND = 1
+LOWER_BOUND = 2
+UPPER_BOUND = 3
+
+# Every entry is two 64 bit words:
+# Key word: bits 0-1 bound, bits 2-7 age, bits 8-15 depth, bits 16-63 top of the zobrist key
+# Data word: bits 0-23 move, bits 24-63 score offset to be positive
+# The low bits of the zobrist key pick the bucket, so only the top bits are kept to tell positions apart.
+# An all zero key word is an empty slot
+BOUND_MASK = 0b11
+AGE_SHIFT = 2
+AGE_MASK = 0b111111
+DEPTH_SHIFT = 8
+DEPTH_MASK = 0b11111111
+KEY_SHIFT = 16
+KEY_MASK = ~0xffff & 0xffffffffffffffff
+
+MOVE_MASK = 0xffffff
+SCORE_SHIFT = 24
+SCORE_OFFSET = 1 << 39
+
+ENTRY_SIZE = 16
+BUCKET_SIZE = 2
+
+# Saved tables are the header followed by the key words and the data words
+TABLE_FILE_MAGIC = b'CHTT'
+TABLE_FILE_HEADER = struct.Struct('<4sQI')
+
+class TranspositionTable:
+    # Fixed size table of searched positions. A bucket holds two entries: the first keeps the deepest search
+    # of the current age, the second takes whatever the first turns down
+    def __init__(self, size_mb = DEFAULT_SIZE_MB):
+        # Power of two bucket count so the index is a mask
+        bucket_count = 1
+        while bucket_count * 2 * BUCKET_SIZE * ENTRY_SIZE <= size_mb * 1024 * 1024:
+            bucket_count *= 2
+        self.bucket_mask = bucket_count - 1
+
+        self.keys = array('Q', bytes(bucket_count * BUCKET_SIZE * 8))
+        self.data = array('Q', bytes(bucket_count * BUCKET_SIZE * 8))
+        self.age = 0
+
+    def probe(self, zobrist_key):
+        # (depth, bound, score, move) of the position, or None
+        index = (zobrist_key & self.bucket_mask) * BUCKET_SIZE
+        key = zobrist_key & KEY_MASK
+
+        for slot in (index, index + 1):
+            key_word = self.keys[slot]
+            if key_word & KEY_MASK == key and key_word:
+                data_word = self.data[slot]
+                return (key_word >> DEPTH_SHIFT & DEPTH_MASK, key_word & BOUND_MASK,
+                        (data_word >> SCORE_SHIFT) - SCORE_OFFSET, data_word & MOVE_MASK)
+        return None
+
+    def store(self, zobrist_key, depth, bound, score, move = 0):
+        index = (zobrist_key & self.bucket_mask) * BUCKET_SIZE
+        key = zobrist_key & KEY_MASK
+
+        key_word = self.keys[index]
+        if key_word and key_word & KEY_MASK != key and key_word >> AGE_SHIFT & AGE_MASK == self.age and depth < key_word >> DEPTH_SHIFT & DEPTH_MASK:
+            index += 1
+            key_word = self.keys[index]
+
+        # A search that found no best move keeps the move already stored for the position
+        if not move and key_word & KEY_MASK == key:
+            move = self.data[index] & MOVE_MASK
+
+        self.keys[index] = key | depth << DEPTH_SHIFT | self.age << AGE_SHIFT | bound
+        self.data[index] = score + SCORE_OFFSET << SCORE_SHIFT | move
+
+    def new_search(self):
+        # Entries of older searches are still probed but no longer protected from replacement
+        self.age = self.age + 1 & AGE_MASK
+
+    def save(self, path):
+        # Zobrist keys are drawn from a fixed seed, so a saved table is still valid in the next run
+        word_bytes = len(self.keys) * 8
+        size = TABLE_FILE_HEADER.size + 2 * word_bytes
+        with open(path, 'wb+') as file:
+            file.truncate(size)
+            with mmap.mmap(file.fileno(), size) as memory:
+                TABLE_FILE_HEADER.pack_into(memory, 0, TABLE_FILE_MAGIC, self.bucket_mask + 1, self.age)
+                offset = TABLE_FILE_HEADER.size
+                memory[offset:offset + word_bytes] = memoryview(self.keys).cast('B')
+                memory[offset + word_bytes:size] = memoryview(self.data).cast('B')
+
+    def load(self, path):
+        # Takes the size of the saved table
+        with open(path, 'rb') as file, mmap.mmap(file.fileno(), 0, access = mmap.ACCESS_READ) as memory:
+            magic, bucket_count, age = TABLE_FILE_HEADER.unpack_from(memory, 0)
+            word_bytes = bucket_count * BUCKET_SIZE * 8
+            if magic != TABLE_FILE_MAGIC or len(memory) != TABLE_FILE_HEADER.size + 2 * word_bytes:
+                raise ValueError(f"{path} is not a saved transposition table")
+
+            offset = TABLE_FILE_HEADER.size
+            self.keys = array('Q', memory[offset:offset + word_bytes])
+            self.data = array('Q', memory[offset + word_bytes:offset + 2 * word_bytes])
+            self.bucket_mask = bucket_count - 1
+            self.age = age
+
+    def clear(self):
+        self.keys = array('Q', bytes(len(self.keys) * 8))
+        self.data = array('Q', bytes(len(self.data) * 8))
+        self.age = 0
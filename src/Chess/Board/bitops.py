@@ -0,0 +1,29 @@
+# Bit manipulation helpers for bitboards. Position 0 is the least significant bit.
+
+SQUARE_BB = [1 << position for position in range(64)]
+
+def lsb(bitboard):
+    return (bitboard & -bitboard).bit_length() - 1
+
+def msb(bitboard):
+    return bitboard.bit_length() - 1
+
+def popcount(bitboard):
+    return bitboard.bit_count()
+
+def pop_lsb(bitboard):
+    # Returns the index of the least significant set bit and the bitboard without it
+    bitboard_position = bitboard & -bitboard
+    return bitboard_position.bit_length() - 1, bitboard ^ bitboard_position
+
+def bitboard_to_positions(bitboard):
+    while bitboard:
+        bitboard_position = bitboard & -bitboard
+        yield bitboard_position.bit_length() - 1
+        bitboard ^= bitboard_position
+
+def bitboard_to_bitboard_positions(bitboard):
+    while bitboard:
+        bitboard_position = bitboard & -bitboard
+        yield (bitboard_position.bit_length() - 1, bitboard_position)
+        bitboard ^= bitboard_position
@@ -1,8 +1,11 @@
-import string, math, random
+import string
 
 from Chess.Board import pieces
-from Chess.Board.move import Move 
-from Chess.Board.pre_computed_data import DISTANCE_TO_EDGE, KNIGHT_MOVES, KING_MOVES
+from Chess.Board.bitops import SQUARE_BB, msb, bitboard_to_positions, bitboard_to_bitboard_positions
+from Chess.Board.move import EN_PASSANT_FLAG, PROMOTION_MASK, QUEENSIDE_CASTLE_FLAG, KINGSIDE_CASTLE_FLAG, CAPTURE_MASK, WHITE_TO_MOVE_FLAG, CAPTURE_VALUES, get_start_position, get_end_position, get_captured_piece, get_promotion_piece_type
+from Chess.Board.pre_computed_data import DISTANCE_TO_EDGE, KNIGHT_MOVES, KING_MOVES, BETWEEN, LINE, KNIGHT_ATTACKS, KING_ATTACKS, WHITE_PAWN_ATTACKS, BLACK_PAWN_ATTACKS
+from Chess.Board.magic_bitboards import get_bishop_attacks, get_rook_attacks, get_queen_attacks
+from Chess.Board.zobrist import ZOBRIST_PIECE_NUMBERS, ZOBRIST_CASTLING_NUMBERS, ZOBRIST_EN_PASSANT_NUMBERS, ZOBRIST_WHITE_TO_MOVE_NUMBER
 
 STARTING_FEN = 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1'
 #STARTING_FEN = 'rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8'
@@ -13,9 +16,31 @@ STARTING_FEN = 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1'
 
 #STARTING_FEN = 'rnbqkbnr/ppp1pppp/5n2/3P4/3P4/8/PPP2PPP/RNBQKBNR b KQkq - 0 1'
 
-SLIDING_PIECE_DIRECTION_OFFSETS = [ 1, -1, 8, -8, 7, -7, 9, -9 ]
+WHITE_KINGSIDE_CASTLE = 0b10000
+WHITE_QUEENSIDE_CASTLE = 0b1000
+BLACK_KINGSIDE_CASTLE = 0b100
+BLACK_QUEENSIDE_CASTLE = 0b10
+
+# Castling rights that survive a move starting or ending on each square
+CASTLING_RIGHTS_MASKS = [0b11110] * 64
+CASTLING_RIGHTS_MASKS[0] = 0b11110 & ~BLACK_QUEENSIDE_CASTLE
+CASTLING_RIGHTS_MASKS[4] = 0b11110 & ~(BLACK_KINGSIDE_CASTLE | BLACK_QUEENSIDE_CASTLE)
+CASTLING_RIGHTS_MASKS[7] = 0b11110 & ~BLACK_KINGSIDE_CASTLE
+CASTLING_RIGHTS_MASKS[56] = 0b11110 & ~WHITE_QUEENSIDE_CASTLE
+CASTLING_RIGHTS_MASKS[60] = 0b11110 & ~(WHITE_KINGSIDE_CASTLE | WHITE_QUEENSIDE_CASTLE)
+CASTLING_RIGHTS_MASKS[63] = 0b11110 & ~WHITE_KINGSIDE_CASTLE
+
+FULL_BOARD = 2**64 - 1
 
 class Board:
+    # Fixed attribute layout, every piece of state is a plain slot rather than a dict entry or property
+    __slots__ = (
+        'pieces', 'mailbox', 'white_to_move', 'castling_rules', 'en_passant_target', 'half_moves', 'full_moves',
+        'moves', 'previous_positions', 'position_counts', 'zobrist_key',
+        'attack_tables', 'white_pieces_attack_table', 'black_pieces_attack_table', 'white_in_check', 'black_in_check', 'player_in_check',
+        'checkers', 'check_mask', 'pinned_pieces', 'state_history', 'attack_table_changes'
+    )
+
     def __init__(self, FEN = STARTING_FEN):
         self.setup_board(FEN)
 
@@ -30,39 +55,39 @@ class Board:
         # Remove slashes and turn numbers into n number of 0s for easier use
         parsed_board_string = ''.join([piece if piece in string.ascii_letters else '0' * int(piece) if piece.isdigit() else '' for piece in board_data])
         
-        self.pieces = {}
+        # Bitboards indexed by the piece constants, so pieces[pieces.WHITE] or pieces[pieces.KNIGHT] index a plain list
+        self.pieces = [0] * (pieces.WHITE + 1)
 
-        self.pieces[pieces.WHITE] = sum([2**position for position, piece in enumerate(parsed_board_string) if piece in string.ascii_uppercase])
-        self.pieces[pieces.BLACK] = sum([2**position for position, piece in enumerate(parsed_board_string) if piece in string.ascii_lowercase])
+        self.pieces[pieces.WHITE] = sum([SQUARE_BB[position] for position, piece in enumerate(parsed_board_string) if piece in string.ascii_uppercase])
+        self.pieces[pieces.BLACK] = sum([SQUARE_BB[position] for position, piece in enumerate(parsed_board_string) if piece in string.ascii_lowercase])
 
-        self.pieces[pieces.PAWN] = sum([2**position for position, piece in enumerate(parsed_board_string) if piece.lower() == 'p'])
-        self.pieces[pieces.KNIGHT] = sum([2**position for position, piece in enumerate(parsed_board_string) if piece.lower() == 'n'])
-        self.pieces[pieces.BISHOP] = sum([2**position for position, piece in enumerate(parsed_board_string) if piece.lower() == 'b'])
-        self.pieces[pieces.ROOK] = sum([2**position for position, piece in enumerate(parsed_board_string) if piece.lower() == 'r'])
-        self.pieces[pieces.QUEEN] = sum([2**position for position, piece in enumerate(parsed_board_string) if piece.lower() == 'q'])
-        self.pieces[pieces.KING] = sum([2**position for position, piece in enumerate(parsed_board_string) if piece.lower() == 'k'])
-
-        # Data such as who's move it is, who is in check, who can castle where
-        # and whether an en passant is available is stored in 1 byte
-        self.game_data = 0
-        self.en_passant_target = 0
+        self.pieces[pieces.PAWN] = sum([SQUARE_BB[position] for position, piece in enumerate(parsed_board_string) if piece.lower() == 'p'])
+        self.pieces[pieces.KNIGHT] = sum([SQUARE_BB[position] for position, piece in enumerate(parsed_board_string) if piece.lower() == 'n'])
+        self.pieces[pieces.BISHOP] = sum([SQUARE_BB[position] for position, piece in enumerate(parsed_board_string) if piece.lower() == 'b'])
+        self.pieces[pieces.ROOK] = sum([SQUARE_BB[position] for position, piece in enumerate(parsed_board_string) if piece.lower() == 'r'])
+        self.pieces[pieces.QUEEN] = sum([SQUARE_BB[position] for position, piece in enumerate(parsed_board_string) if piece.lower() == 'q'])
+        self.pieces[pieces.KING] = sum([SQUARE_BB[position] for position, piece in enumerate(parsed_board_string) if piece.lower() == 'k'])
 
-        if color_data == 'w':
-            self.game_data += 0b10000000
+        # The piece (color | type) on each square, 0 if empty, kept in sync with the bitboards
+        self.mailbox = [0] * 64
+        for position, piece in enumerate(parsed_board_string):
+            if piece in string.ascii_letters:
+                self.mailbox[position] = (pieces.WHITE if piece in string.ascii_uppercase else pieces.BLACK) | 'pnbrqk'.index(piece.lower()) + 1
 
-        # Check whether anyone is in check, bits 6 and 7
+        self.white_to_move = color_data == 'w'
 
+        self.castling_rules = 0
         if 'K' in castling_data:
-            self.game_data += 0b10000
+            self.castling_rules |= WHITE_KINGSIDE_CASTLE
         if 'Q' in castling_data:
-            self.game_data += 0b1000
+            self.castling_rules |= WHITE_QUEENSIDE_CASTLE
         if 'k' in castling_data:
-            self.game_data += 0b100
+            self.castling_rules |= BLACK_KINGSIDE_CASTLE
         if 'q' in castling_data:
-            self.game_data += 0b10
+            self.castling_rules |= BLACK_QUEENSIDE_CASTLE
         
+        self.en_passant_target = 0
         if en_passant_target_data != '-':
-            self.game_data += 0b1
             self.en_passant_target = self.get_bitboard_position_from_square(en_passant_target_data)
 
         self.half_moves = int(half_moves)
@@ -71,310 +96,255 @@ class Board:
         self.moves = []
         self.previous_positions = []
 
+        # Irreversible state saved by make_move and restored as is by undo_move
+        self.state_history = []
+        self.attack_table_changes = dict()
+
         self.generate_attack_tables()
+        self.update_checkers_and_pins()
         self.generate_zobrist_key()
 
+        # How many times each position has occurred, kept in step with previous_positions
+        self.position_counts = {self.zobrist_key: 1}
+
     def fen_is_valid(self, FEN):
         return True
 
     def generate_zobrist_key(self):
-        # Generate Pseudorandom Numbers
-
-        self.zobrist_piece_numbers = [None] * 33
-        for piece in range(1, 7):
-            self.zobrist_piece_numbers[pieces.WHITE | piece] = [random.randrange(2**64) for _ in range(64)]
-            self.zobrist_piece_numbers[pieces.BLACK | piece] = [random.randrange(2**64) for _ in range(64)]
-        
-        self.zobrist_castling_numbers = [random.randrange(2**64) for _ in range(4)]
-        self.zobrist_en_passant_numbers = [random.randrange(2**64) for _ in range(8)]
-        self.zobrist_white_to_move_number = random.randrange(2**64)
-
         self.zobrist_key = 0
 
-        for piece in self.bitboard_to_bitboard_positions(self.pieces[pieces.WHITE]):
-            if self.is_pawn(piece[1]): self.zobrist_key ^= self.zobrist_piece_numbers[pieces.WHITE | pieces.PAWN][piece[0]]
-            if self.is_knight(piece[1]): self.zobrist_key ^= self.zobrist_piece_numbers[pieces.WHITE | pieces.KNIGHT][piece[0]]
-            if self.is_bishop(piece[1]): self.zobrist_key ^= self.zobrist_piece_numbers[pieces.WHITE | pieces.BISHOP][piece[0]]
-            if self.is_rook(piece[1]): self.zobrist_key ^= self.zobrist_piece_numbers[pieces.WHITE | pieces.ROOK][piece[0]]
-            if self.is_queen(piece[1]): self.zobrist_key ^= self.zobrist_piece_numbers[pieces.WHITE | pieces.QUEEN][piece[0]]
-            if self.is_king(piece[1]): self.zobrist_key ^= self.zobrist_piece_numbers[pieces.WHITE | pieces.KING][piece[0]]
-        for piece in self.bitboard_to_bitboard_positions(self.pieces[pieces.BLACK]):
-            if self.is_pawn(piece[1]): self.zobrist_key ^= self.zobrist_piece_numbers[pieces.BLACK | pieces.PAWN][piece[0]]
-            if self.is_knight(piece[1]): self.zobrist_key ^= self.zobrist_piece_numbers[pieces.BLACK | pieces.KNIGHT][piece[0]]
-            if self.is_bishop(piece[1]): self.zobrist_key ^= self.zobrist_piece_numbers[pieces.BLACK | pieces.BISHOP][piece[0]]
-            if self.is_rook(piece[1]): self.zobrist_key ^= self.zobrist_piece_numbers[pieces.BLACK | pieces.ROOK][piece[0]]
-            if self.is_queen(piece[1]): self.zobrist_key ^= self.zobrist_piece_numbers[pieces.BLACK | pieces.QUEEN][piece[0]]
-            if self.is_king(piece[1]): self.zobrist_key ^= self.zobrist_piece_numbers[pieces.BLACK | pieces.KING][piece[0]]
+        for position, piece in enumerate(self.mailbox):
+            if piece: self.zobrist_key ^= ZOBRIST_PIECE_NUMBERS[piece][position]
         
-        if self.white_can_kingside_castle: self.zobrist_key ^= self.zobrist_castling_numbers[0]
-        if self.white_can_queenside_castle: self.zobrist_key ^= self.zobrist_castling_numbers[1]
-        if self.black_can_kingside_castle: self.zobrist_key ^= self.zobrist_castling_numbers[2]
-        if self.black_can_queenside_castle: self.zobrist_key ^= self.zobrist_castling_numbers[3]
+        if self.castling_rules & WHITE_KINGSIDE_CASTLE: self.zobrist_key ^= ZOBRIST_CASTLING_NUMBERS[0]
+        if self.castling_rules & WHITE_QUEENSIDE_CASTLE: self.zobrist_key ^= ZOBRIST_CASTLING_NUMBERS[1]
+        if self.castling_rules & BLACK_KINGSIDE_CASTLE: self.zobrist_key ^= ZOBRIST_CASTLING_NUMBERS[2]
+        if self.castling_rules & BLACK_QUEENSIDE_CASTLE: self.zobrist_key ^= ZOBRIST_CASTLING_NUMBERS[3]
 
-        if self.is_en_passant_target:
-            self.zobrist_key ^= self.zobrist_en_passant_numbers[math.log2(self.en_passant_target) % 8]
+        if self.en_passant_target:
+            self.zobrist_key ^= ZOBRIST_EN_PASSANT_NUMBERS[msb(self.en_passant_target) % 8]
         
         if self.white_to_move:
-            self.zobrist_key ^= self.zobrist_white_to_move_number
+            self.zobrist_key ^= ZOBRIST_WHITE_TO_MOVE_NUMBER
 
     # -------------------------------- MOVE MAKING / UNDOING --------------------------------
 
     def make_move(self, move):
-        start_bitboard_position = 2**move.start_position
-        end_bitboard_position = 2**move.end_position
-
-        if move.is_capture:
-            self.capture_piece(end_bitboard_position)
+        start_position = get_start_position(move)
+        end_position = get_end_position(move)
+        start_bitboard_position = SQUARE_BB[start_position]
+        end_bitboard_position = SQUARE_BB[end_position]
+
+        previous_castling_rules = self.castling_rules
+        previous_en_passant_target = self.en_passant_target
+
+        # Everything undo_move can't cheaply work out again. The attack table entries overwritten by
+        # this move are recorded into attack_table_changes as they are updated
+        self.attack_table_changes = dict()
+        self.state_history.append((
+            self.zobrist_key, previous_castling_rules, previous_en_passant_target,
+            self.checkers, self.check_mask, self.pinned_pieces,
+            self.white_pieces_attack_table, self.black_pieces_attack_table, self.white_in_check, self.black_in_check, self.player_in_check,
+            self.attack_table_changes
+        ))
+
+        if move & CAPTURE_MASK:
+            self.capture_piece(end_position)
         
-        elif move.is_en_passant:
-            if move.is_white_to_move:
-                self.capture_piece(end_bitboard_position << 8)
+        elif move & EN_PASSANT_FLAG:
+            if move & WHITE_TO_MOVE_FLAG:
+                self.capture_piece(end_position + 8)
             else:
-                self.capture_piece(end_bitboard_position >> 8)
+                self.capture_piece(end_position - 8)
 
-        self.is_en_passant_target = False
         self.en_passant_target = 0
 
         # Check if pawn double move to add as en passant target
         if self.is_pawn(start_bitboard_position) and (start_bitboard_position << 16 == end_bitboard_position or start_bitboard_position >> 16 == end_bitboard_position):
-            self.is_en_passant_target = True
-                
-            if move.is_white_to_move:
+            if move & WHITE_TO_MOVE_FLAG:
                 self.en_passant_target = start_bitboard_position >> 8
             else:
                 self.en_passant_target = start_bitboard_position << 8
 
-        # Check if king to disallow castling
-        elif start_bitboard_position == 0b1000000000000000000000000000000000000000000000000000000000000:
-            self.white_can_kingside_castle = False
-            self.white_can_queenside_castle = False
-        elif start_bitboard_position == 0b10000:
-            self.black_can_kingside_castle = False
-            self.black_can_queenside_castle = False
-        
-        # Check if rook to disallow castling
-        elif (start_bitboard_position | end_bitboard_position) & 0b1000000000000000000000000000000000000000000000000000000000000000 > 0:
-            self.white_can_kingside_castle = False
-        elif (start_bitboard_position | end_bitboard_position) & 0b100000000000000000000000000000000000000000000000000000000 > 0:
-            self.white_can_queenside_castle = False
-        elif (start_bitboard_position | end_bitboard_position) & 0b10000000 > 0:
-            self.black_can_kingside_castle = False
-        elif (start_bitboard_position | end_bitboard_position) & 0b1 > 0:
-            self.black_can_queenside_castle = False
-
-        self.update_piece_position(start_bitboard_position, end_bitboard_position)
-
-        if move.is_promotion:
+        # Moving the king or a rook, or capturing a rook, loses the castling rights tied to that square
+        self.castling_rules &= CASTLING_RIGHTS_MASKS[start_position] & CASTLING_RIGHTS_MASKS[end_position]
+
+        self.update_piece_position(start_position, end_position)
+
+        if move & PROMOTION_MASK:
+            promotion_piece_type = get_promotion_piece_type(move)
             self.pieces[pieces.PAWN] -= end_bitboard_position
-            if move.is_promotion_to_knight:
-                self.pieces[pieces.KNIGHT] |= end_bitboard_position
-            elif move.is_promotion_to_bishop:
-                self.pieces[pieces.BISHOP] |= end_bitboard_position
-            elif move.is_promotion_to_rook:
-                self.pieces[pieces.ROOK] |= end_bitboard_position
-            elif move.is_promotion_to_queen:
-                self.pieces[pieces.QUEEN] |= end_bitboard_position
-
-        if move.is_kingside_castle:
-            if move.is_white_to_move:
-                self.update_piece_position(2**63, 2**61)
+            self.pieces[promotion_piece_type] |= end_bitboard_position
+            self.mailbox[end_position] ^= pieces.PAWN ^ promotion_piece_type
+
+        if move & KINGSIDE_CASTLE_FLAG:
+            if move & WHITE_TO_MOVE_FLAG:
+                self.update_piece_position(63, 61)
             else:
-                self.update_piece_position(2**7, 2**5)
-        elif move.is_queenside_castle:
-            if move.is_white_to_move:
-                self.update_piece_position(2**56, 2**59)
+                self.update_piece_position(7, 5)
+        elif move & QUEENSIDE_CASTLE_FLAG:
+            if move & WHITE_TO_MOVE_FLAG:
+                self.update_piece_position(56, 59)
             else:
-                self.update_piece_position(0b1, 0b1000)
+                self.update_piece_position(0, 3)
 
         self.update_attack_tables(move, start_bitboard_position, end_bitboard_position)
-        self.update_zobrist_key(move, end_bitboard_position)
+        self.update_side_attack_tables()
+        self.update_zobrist_key(move, previous_castling_rules, previous_en_passant_target)
 
         self.previous_positions.append(self.zobrist_key)
+        self.position_counts[self.zobrist_key] = self.position_counts.get(self.zobrist_key, 0) + 1
 
         self.white_to_move = not self.white_to_move
+
+        self.update_checkers_and_pins()
     
     def undo_move(self, move):
-        start_bitboard_position = 2**move.start_position
-        end_bitboard_position = 2**move.end_position
-
-        self.update_zobrist_key(move, end_bitboard_position)
-
-        if move.is_promotion:
-            if move.is_promotion_to_knight:
-                self.pieces[pieces.KNIGHT] -= end_bitboard_position
-            elif move.is_promotion_to_bishop:
-                self.pieces[pieces.BISHOP] -= end_bitboard_position
-            elif move.is_promotion_to_rook:
-                self.pieces[pieces.ROOK] -= end_bitboard_position
-            elif move.is_promotion_to_queen:
-                self.pieces[pieces.QUEEN] -= end_bitboard_position
+        start_position = get_start_position(move)
+        end_position = get_end_position(move)
+        end_bitboard_position = SQUARE_BB[end_position]
+
+        (
+            self.zobrist_key, self.castling_rules, self.en_passant_target,
+            self.checkers, self.check_mask, self.pinned_pieces,
+            self.white_pieces_attack_table, self.black_pieces_attack_table, self.white_in_check, self.black_in_check, self.player_in_check,
+            attack_table_changes
+        ) = self.state_history.pop()
+        self.attack_tables.update(attack_table_changes)
+
+        if move & PROMOTION_MASK:
+            promotion_piece_type = get_promotion_piece_type(move)
+            self.pieces[promotion_piece_type] -= end_bitboard_position
             self.pieces[pieces.PAWN] |= end_bitboard_position
+            self.mailbox[end_position] ^= pieces.PAWN ^ promotion_piece_type
 
-        self.update_piece_position(end_bitboard_position, start_bitboard_position)
+        self.update_piece_position(end_position, start_position)
 
-        if move.is_kingside_castle:
-            if move.is_white_to_move:
-                self.update_piece_position(2**61, 2**63)
+        if move & KINGSIDE_CASTLE_FLAG:
+            if move & WHITE_TO_MOVE_FLAG:
+                self.update_piece_position(61, 63)
             else:
-                self.update_piece_position(2**5, 2**7)
-        elif move.is_queenside_castle:
-            if move.is_white_to_move:
-                self.update_piece_position(2**59, 2**56)
+                self.update_piece_position(5, 7)
+        elif move & QUEENSIDE_CASTLE_FLAG:
+            if move & WHITE_TO_MOVE_FLAG:
+                self.update_piece_position(59, 56)
             else:
-                self.update_piece_position(0b1000, 0b1)
+                self.update_piece_position(3, 0)
 
-        self.castling_rules = move.previous_castling_rules
-        self.en_passant_target = move.previous_en_passant_target
-        self.is_en_passant_target = bool(move.previous_en_passant_target)
-
-        if move.is_capture:
-            self.undo_capture(move, end_bitboard_position)
-        
-        if move.is_en_passant:
-            self.undo_en_passant(move, end_bitboard_position)
+        if move & CAPTURE_MASK:
+            self.undo_capture(move)
         
-        self.update_attack_tables(move, start_bitboard_position, end_bitboard_position)
+        if move & EN_PASSANT_FLAG:
+            self.undo_en_passant(move)
 
-        self.previous_positions.pop()
+        previous_position = self.previous_positions.pop()
+        self.position_counts[previous_position] -= 1
+        if self.position_counts[previous_position] == 0:
+            del self.position_counts[previous_position]
 
         self.white_to_move = not self.white_to_move
 
-    def update_piece_position(self, start_bitboard_position, end_bitboard_position):
-        position_change = end_bitboard_position - start_bitboard_position
+    def update_piece_position(self, start_position, end_position):
+        piece = self.mailbox[start_position]
+        position_change = (1 << end_position) - (1 << start_position)
 
-        if self.is_white(start_bitboard_position): self.pieces[pieces.WHITE] += position_change
-        else: self.pieces[pieces.BLACK] += position_change
-        
-        if self.is_pawn(start_bitboard_position): self.pieces[pieces.PAWN] += position_change
-        elif self.is_knight(start_bitboard_position): self.pieces[pieces.KNIGHT] += position_change
-        elif self.is_bishop(start_bitboard_position): self.pieces[pieces.BISHOP] += position_change
-        elif self.is_rook(start_bitboard_position): self.pieces[pieces.ROOK] += position_change
-        elif self.is_queen(start_bitboard_position): self.pieces[pieces.QUEEN] += position_change
-        elif self.is_king(start_bitboard_position): self.pieces[pieces.KING] += position_change
-
-    def update_zobrist_key(self, move, end_bitboard_position):
-        piece_color = pieces.WHITE if move.is_white_to_move else pieces.BLACK
-
-        if move.is_promotion:
-            self.zobrist_key ^= self.zobrist_piece_numbers[piece_color | pieces.PAWN][move.start_position]
-            if move.is_promotion_to_knight:
-                self.zobrist_key ^= self.zobrist_piece_numbers[piece_color | pieces.KNIGHT][move.start_position]
-            elif move.is_promotion_to_bishop:
-                self.zobrist_key ^= self.zobrist_piece_numbers[piece_color | pieces.BISHOP][move.start_position]
-            elif move.is_promotion_to_rook:
-                self.zobrist_key ^= self.zobrist_piece_numbers[piece_color | pieces.ROOK][move.start_position]
-            else:
-                self.zobrist_key ^= self.zobrist_piece_numbers[piece_color | pieces.QUEEN][move.start_position]
-        elif self.is_pawn(end_bitboard_position):
-            self.zobrist_key ^= self.zobrist_piece_numbers[piece_color | pieces.PAWN][move.end_position]
-            self.zobrist_key ^= self.zobrist_piece_numbers[piece_color | pieces.PAWN][move.start_position]
-        elif self.is_knight(end_bitboard_position):
-            self.zobrist_key ^= self.zobrist_piece_numbers[piece_color | pieces.KNIGHT][move.end_position]
-            self.zobrist_key ^= self.zobrist_piece_numbers[piece_color | pieces.KNIGHT][move.start_position]
-        elif self.is_bishop(end_bitboard_position):
-            self.zobrist_key ^= self.zobrist_piece_numbers[piece_color | pieces.BISHOP][move.end_position]
-            self.zobrist_key ^= self.zobrist_piece_numbers[piece_color | pieces.BISHOP][move.start_position]
-        elif self.is_rook(end_bitboard_position):
-            self.zobrist_key ^= self.zobrist_piece_numbers[piece_color | pieces.ROOK][move.end_position]
-            self.zobrist_key ^= self.zobrist_piece_numbers[piece_color | pieces.ROOK][move.start_position]
-        elif self.is_queen(end_bitboard_position):
-            self.zobrist_key ^= self.zobrist_piece_numbers[piece_color | pieces.QUEEN][move.end_position]
-            self.zobrist_key ^= self.zobrist_piece_numbers[piece_color | pieces.QUEEN][move.start_position]
-        elif self.is_king(end_bitboard_position):
-            self.zobrist_key ^= self.zobrist_piece_numbers[piece_color | pieces.KING][move.end_position]
-            self.zobrist_key ^= self.zobrist_piece_numbers[piece_color | pieces.KING][move.start_position]
+        self.pieces[piece & pieces.COLOR_MASK] += position_change
+        self.pieces[piece & pieces.TYPE_MASK] += position_change
+
+        self.mailbox[end_position] = piece
+        self.mailbox[start_position] = 0
+
+    def update_zobrist_key(self, move, previous_castling_rules, previous_en_passant_target):
+        start_position = get_start_position(move)
+        end_position = get_end_position(move)
+        piece_color = pieces.WHITE if move & WHITE_TO_MOVE_FLAG else pieces.BLACK
+
+        if move & PROMOTION_MASK:
+            self.zobrist_key ^= ZOBRIST_PIECE_NUMBERS[piece_color | pieces.PAWN][start_position]
+            self.zobrist_key ^= ZOBRIST_PIECE_NUMBERS[piece_color | get_promotion_piece_type(move)][end_position]
+        else:
+            piece = self.mailbox[end_position]
+            self.zobrist_key ^= ZOBRIST_PIECE_NUMBERS[piece][end_position]
+            self.zobrist_key ^= ZOBRIST_PIECE_NUMBERS[piece][start_position]
         
-        if move.is_capture:
-            if move.captured_pawn:
-                self.zobrist_key ^= self.zobrist_piece_numbers[(0b11000 ^ piece_color) | pieces.PAWN][move.start_position]
-            elif move.captured_knight:
-                self.zobrist_key ^= self.zobrist_piece_numbers[(0b11000 ^ piece_color) | pieces.KNIGHT][move.start_position]
-            elif move.captured_bishop:
-                self.zobrist_key ^= self.zobrist_piece_numbers[(0b11000 ^ piece_color) | pieces.BISHOP][move.start_position]
-            elif move.captured_rook:
-                self.zobrist_key ^= self.zobrist_piece_numbers[(0b11000 ^ piece_color) | pieces.ROOK][move.start_position]
-            elif move.captured_queen:
-                self.zobrist_key ^= self.zobrist_piece_numbers[(0b11000 ^ piece_color) | pieces.QUEEN][move.start_position]
-        elif move.is_en_passant:
-            if move.is_white_to_move:
-                self.zobrist_key ^= self.zobrist_piece_numbers[pieces.BLACK | pieces.PAWN][move.end_position + 8]
+        if move & CAPTURE_MASK:
+            self.zobrist_key ^= ZOBRIST_PIECE_NUMBERS[get_captured_piece(move)][end_position]
+        elif move & EN_PASSANT_FLAG:
+            if move & WHITE_TO_MOVE_FLAG:
+                self.zobrist_key ^= ZOBRIST_PIECE_NUMBERS[pieces.BLACK | pieces.PAWN][end_position + 8]
             else:
-                self.zobrist_key ^= self.zobrist_piece_numbers[pieces.WHITE | pieces.PAWN][move.end_position - 8]
+                self.zobrist_key ^= ZOBRIST_PIECE_NUMBERS[pieces.WHITE | pieces.PAWN][end_position - 8]
 
-        if move.is_kingside_castle:
-            if move.is_white_to_move:
-                self.zobrist_key ^= self.zobrist_piece_numbers[pieces.WHITE | pieces.ROOK][61]
-                self.zobrist_key ^= self.zobrist_piece_numbers[pieces.WHITE | pieces.ROOK][63]
+        if move & KINGSIDE_CASTLE_FLAG:
+            if move & WHITE_TO_MOVE_FLAG:
+                self.zobrist_key ^= ZOBRIST_PIECE_NUMBERS[pieces.WHITE | pieces.ROOK][61]
+                self.zobrist_key ^= ZOBRIST_PIECE_NUMBERS[pieces.WHITE | pieces.ROOK][63]
             else:
-                self.zobrist_key ^= self.zobrist_piece_numbers[pieces.BLACK | pieces.ROOK][5]
-                self.zobrist_key ^= self.zobrist_piece_numbers[pieces.BLACK | pieces.ROOK][7]
-        elif move.is_queenside_castle:
-            if move.is_white_to_move:
-                self.zobrist_key ^= self.zobrist_piece_numbers[pieces.WHITE | pieces.ROOK][56]
-                self.zobrist_key ^= self.zobrist_piece_numbers[pieces.WHITE | pieces.ROOK][59]
+                self.zobrist_key ^= ZOBRIST_PIECE_NUMBERS[pieces.BLACK | pieces.ROOK][5]
+                self.zobrist_key ^= ZOBRIST_PIECE_NUMBERS[pieces.BLACK | pieces.ROOK][7]
+        elif move & QUEENSIDE_CASTLE_FLAG:
+            if move & WHITE_TO_MOVE_FLAG:
+                self.zobrist_key ^= ZOBRIST_PIECE_NUMBERS[pieces.WHITE | pieces.ROOK][56]
+                self.zobrist_key ^= ZOBRIST_PIECE_NUMBERS[pieces.WHITE | pieces.ROOK][59]
             else:
-                self.zobrist_key ^= self.zobrist_piece_numbers[pieces.BLACK | pieces.ROOK][0]
-                self.zobrist_key ^= self.zobrist_piece_numbers[pieces.BLACK | pieces.ROOK][3]
+                self.zobrist_key ^= ZOBRIST_PIECE_NUMBERS[pieces.BLACK | pieces.ROOK][0]
+                self.zobrist_key ^= ZOBRIST_PIECE_NUMBERS[pieces.BLACK | pieces.ROOK][3]
 
-        if move.previous_castling_rules & 0b10000 != self.white_can_kingside_castle:
-            self.zobrist_key ^= self.zobrist_castling_numbers[0]
-        if move.previous_castling_rules & 0b1000 != self.white_can_queenside_castle:
-            self.zobrist_key ^= self.zobrist_castling_numbers[1]
-        if move.previous_castling_rules & 0b100 != self.black_can_kingside_castle:
-            self.zobrist_key ^= self.zobrist_castling_numbers[2]
-        if move.previous_castling_rules & 0b10 != self.black_can_queenside_castle:
-            self.zobrist_key ^= self.zobrist_castling_numbers[3]
+        castling_rules_change = previous_castling_rules ^ self.castling_rules
+        if castling_rules_change:
+            if castling_rules_change & WHITE_KINGSIDE_CASTLE:
+                self.zobrist_key ^= ZOBRIST_CASTLING_NUMBERS[0]
+            if castling_rules_change & WHITE_QUEENSIDE_CASTLE:
+                self.zobrist_key ^= ZOBRIST_CASTLING_NUMBERS[1]
+            if castling_rules_change & BLACK_KINGSIDE_CASTLE:
+                self.zobrist_key ^= ZOBRIST_CASTLING_NUMBERS[2]
+            if castling_rules_change & BLACK_QUEENSIDE_CASTLE:
+                self.zobrist_key ^= ZOBRIST_CASTLING_NUMBERS[3]
 
-        if move.previous_en_passant_target != 0:
-            self.zobrist_key ^= self.zobrist_en_passant_numbers[int(math.log2(move.previous_en_passant_target) % 8)]
-        if self.is_en_passant_target:
-            self.zobrist_key ^= self.zobrist_en_passant_numbers[int(math.log2(self.en_passant_target) % 8)]
+        if previous_en_passant_target != 0:
+            self.zobrist_key ^= ZOBRIST_EN_PASSANT_NUMBERS[msb(previous_en_passant_target) % 8]
+        if self.en_passant_target:
+            self.zobrist_key ^= ZOBRIST_EN_PASSANT_NUMBERS[msb(self.en_passant_target) % 8]
 
 
-        self.zobrist_key ^= self.zobrist_white_to_move_number
+        self.zobrist_key ^= ZOBRIST_WHITE_TO_MOVE_NUMBER
 
-    def capture_piece(self, bitboard_position):
-        if self.is_white(bitboard_position): self.pieces[pieces.WHITE] -= bitboard_position
-        else: self.pieces[pieces.BLACK] -= bitboard_position
-        
-        if self.is_pawn(bitboard_position): self.pieces[pieces.PAWN] -= bitboard_position
-        elif self.is_knight(bitboard_position): self.pieces[pieces.KNIGHT] -= bitboard_position
-        elif self.is_bishop(bitboard_position): self.pieces[pieces.BISHOP] -= bitboard_position
-        elif self.is_rook(bitboard_position): self.pieces[pieces.ROOK] -= bitboard_position
-        elif self.is_queen(bitboard_position): self.pieces[pieces.QUEEN] -= bitboard_position
-        elif self.is_king(bitboard_position): self.pieces[pieces.KING] -= bitboard_position
+    def capture_piece(self, position):
+        piece = self.mailbox[position]
+        bitboard_position = 1 << position
+
+        self.pieces[piece & pieces.COLOR_MASK] -= bitboard_position
+        self.pieces[piece & pieces.TYPE_MASK] -= bitboard_position
+
+        self.mailbox[position] = 0
     
-    def undo_capture(self, move, bitboard_position):
-        if move.captured_white: self.pieces[pieces.WHITE] |= bitboard_position
-        else: self.pieces[pieces.BLACK] |= bitboard_position
-
-        if move.captured_pawn: self.pieces[pieces.PAWN] |= bitboard_position
-        elif move.captured_knight: self.pieces[pieces.KNIGHT] |= bitboard_position
-        elif move.captured_bishop: self.pieces[pieces.BISHOP] |= bitboard_position
-        elif move.captured_rook: self.pieces[pieces.ROOK] |= bitboard_position
-        elif move.captured_queen: self.pieces[pieces.QUEEN] |= bitboard_position
-        elif move.captured_king: self.pieces[pieces.KING] |= bitboard_position
+    def undo_capture(self, move):
+        end_position = get_end_position(move)
+        piece = get_captured_piece(move)
+        bitboard_position = 1 << end_position
+
+        self.pieces[piece & pieces.COLOR_MASK] |= bitboard_position
+        self.pieces[piece & pieces.TYPE_MASK] |= bitboard_position
+
+        self.mailbox[end_position] = piece
     
-    def undo_en_passant(self, move, bitboard_position):
-        if move.is_white_to_move:
-            pawn_position = bitboard_position << 8
-            self.pieces[pieces.BLACK] |= pawn_position
+    def undo_en_passant(self, move):
+        end_position = get_end_position(move)
+        if move & WHITE_TO_MOVE_FLAG:
+            position = end_position + 8
+            self.pieces[pieces.BLACK] |= 1 << position
+            self.mailbox[position] = pieces.BLACK | pieces.PAWN
         else:
-            pawn_position = bitboard_position >> 8
-            self.pieces[pieces.WHITE] |= pawn_position
+            position = end_position - 8
+            self.pieces[pieces.WHITE] |= 1 << position
+            self.mailbox[position] = pieces.WHITE | pieces.PAWN
         
-        self.pieces[pieces.PAWN] |= pawn_position
+        self.pieces[pieces.PAWN] |= 1 << position
     
     # -------------------------------- ATTACK TABLES --------------------------------
 
     def generate_attack_tables(self):
         self.attack_tables = dict()
-        self.moves_blocking_white_check = 2**64 - 1
-        self.moves_blocking_black_check = 2**64 - 1
-        self.pieces_attacking_white_king = []
-        self.pieces_attacking_black_king = []
-        self.pinned_piece_moves = dict()
-        self.pinning_pieces = dict()
         
         for position in range(64):
             bitboard_position = self.get_bitboard_position_from_index(position)
@@ -384,39 +354,52 @@ class Board:
                 continue
 
             self.update_piece_attack_table(position, bitboard_position)
+        
+        self.update_side_attack_tables()
     
+    def update_side_attack_tables(self):
+        # Union of every piece's attacks per side and who is in check, cached until the position changes
+        white_pieces_attack_table = 0
+        for piece in bitboard_to_bitboard_positions(self.pieces[pieces.WHITE]):
+            white_pieces_attack_table |= self.attack_tables[piece[1]]
+        black_pieces_attack_table = 0
+        for piece in bitboard_to_bitboard_positions(self.pieces[pieces.BLACK]):
+            black_pieces_attack_table |= self.attack_tables[piece[1]]
+
+        self.white_pieces_attack_table = white_pieces_attack_table
+        self.black_pieces_attack_table = black_pieces_attack_table
+
+        self.white_in_check = self.pieces[pieces.WHITE] & self.pieces[pieces.KING] & black_pieces_attack_table > 0
+        self.black_in_check = self.pieces[pieces.BLACK] & self.pieces[pieces.KING] & white_pieces_attack_table > 0
+        self.player_in_check = self.white_in_check or self.black_in_check
+
     def update_attack_tables(self, move, start_bitboard_position, end_bitboard_position):
-        self.moves_blocking_white_check = 2**64 - 1
-        self.moves_blocking_black_check = 2**64 - 1
-        self.pieces_attacking_white_king = []
-        self.pieces_attacking_black_king = []
-
-        if start_bitboard_position in self.pinning_pieces:
-            self.pinned_piece_moves.pop(self.pinning_pieces.pop(start_bitboard_position))
-        elif end_bitboard_position in self.pinning_pieces:
-            self.pinned_piece_moves.pop(self.pinning_pieces.pop(end_bitboard_position))
-        if start_bitboard_position in self.pinned_piece_moves:
-            self.pinned_piece_moves.pop(self.pinning_pieces.pop(list(self.pinning_pieces.keys())[list(self.pinning_pieces.values()).index(start_bitboard_position)]))
-        elif end_bitboard_position in self.pinned_piece_moves:
-            self.pinned_piece_moves.pop(self.pinning_pieces.pop(list(self.pinning_pieces.keys())[list(self.pinning_pieces.values()).index(end_bitboard_position)]))
-
-        self.update_piece_attack_table(move.start_position, start_bitboard_position)
-        self.update_piece_attack_table(move.end_position, end_bitboard_position)
-
-        if move.is_kingside_castle:
-            if move.is_white_to_move:
-                self.attack_tables[2**63] = 0
-                self.update_piece_attack_table(61, 2**61)
+        start_position = get_start_position(move)
+        end_position = get_end_position(move)
+        # Squares whose occupancy changed, any slider seeing one of them needs its attacks redone
+        changed_squares = start_bitboard_position | end_bitboard_position
+
+        self.update_piece_attack_table(start_position, start_bitboard_position)
+        self.update_piece_attack_table(end_position, end_bitboard_position)
+
+        if move & KINGSIDE_CASTLE_FLAG:
+            if move & WHITE_TO_MOVE_FLAG:
+                self.update_piece_attack_table(63, SQUARE_BB[63])
+                self.update_piece_attack_table(61, SQUARE_BB[61])
             else:
-                self.attack_tables[0b10000000] = 0
-                self.update_piece_attack_table(5, 0b100000)
-        elif move.is_queenside_castle:
-            if move.is_white_to_move:
-                self.attack_tables[2**56] = 0
-                self.update_piece_attack_table(59, 2**59)
+                self.update_piece_attack_table(7, SQUARE_BB[7])
+                self.update_piece_attack_table(5, SQUARE_BB[5])
+        elif move & QUEENSIDE_CASTLE_FLAG:
+            if move & WHITE_TO_MOVE_FLAG:
+                self.update_piece_attack_table(56, SQUARE_BB[56])
+                self.update_piece_attack_table(59, SQUARE_BB[59])
             else:
-                self.attack_tables[0b1] = 0
-                self.update_piece_attack_table(3, 0b1000)
+                self.update_piece_attack_table(0, SQUARE_BB[0])
+                self.update_piece_attack_table(3, SQUARE_BB[3])
+        elif move & EN_PASSANT_FLAG:
+            captured_position = end_position + 8 if move & WHITE_TO_MOVE_FLAG else end_position - 8
+            self.update_piece_attack_table(captured_position, SQUARE_BB[captured_position])
+            changed_squares |= SQUARE_BB[captured_position]
 
         if self.pieces[pieces.KING] & (start_bitboard_position | end_bitboard_position) > 0:
             if self.is_white(self.pieces[pieces.KING] & (start_bitboard_position | end_bitboard_position)):
@@ -424,34 +407,37 @@ class Board:
             else:
                 enemy_sliding_pieces = self.pieces[pieces.WHITE] & (self.pieces[pieces.BISHOP] | self.pieces[pieces.ROOK] | self.pieces[pieces.QUEEN])
 
-            for piece in self.bitboard_to_bitboard_positions(enemy_sliding_pieces):
-                if piece[1] in self.pinning_pieces:
-                    self.pinned_piece_moves.pop(self.pinning_pieces.pop(piece[1]))
+            for piece in bitboard_to_bitboard_positions(enemy_sliding_pieces):
                 self.update_piece_attack_table(piece[0], piece[1])
 
-        for piece in self.bitboard_to_bitboard_positions(self.pieces[pieces.BISHOP] | self.pieces[pieces.ROOK] | self.pieces[pieces.QUEEN]):
-            if self.attack_tables[piece[1]] & (start_bitboard_position | end_bitboard_position) == 0:
+        for piece in bitboard_to_bitboard_positions(self.pieces[pieces.BISHOP] | self.pieces[pieces.ROOK] | self.pieces[pieces.QUEEN]):
+            if self.attack_tables[piece[1]] & changed_squares == 0:
                 continue
             if piece[1] & (start_bitboard_position | end_bitboard_position) > 0:
                 continue
             self.update_piece_attack_table(piece[0], piece[1])
 
     def update_piece_attack_table(self, position, bitboard_position):
+        # Keep the first value seen this move so undo_move can put it back
+        if bitboard_position not in self.attack_table_changes:
+            self.attack_table_changes[bitboard_position] = self.attack_tables.get(bitboard_position, 0)
         self.attack_tables[bitboard_position] = 0
 
-        if not self.is_piece(bitboard_position):
+        piece_type = self.mailbox[position] & pieces.TYPE_MASK
+
+        if piece_type == 0:
             return
 
-        if self.is_pawn(bitboard_position):
+        if piece_type == pieces.PAWN:
             self.update_pawn_attack_table(position, bitboard_position)
-        elif self.is_knight(bitboard_position):
+        elif piece_type == pieces.KNIGHT:
             self.update_knight_attack_table(position, bitboard_position)
-        elif self.is_bishop(bitboard_position):
-            self.update_sliding_piece_attack_table(position, bitboard_position, 4, 8)
-        elif self.is_rook(bitboard_position):
-            self.update_sliding_piece_attack_table(position, bitboard_position, 0, 4)
-        elif self.is_queen(bitboard_position):
-            self.update_sliding_piece_attack_table(position, bitboard_position, 0, 8)
+        elif piece_type == pieces.BISHOP:
+            self.update_sliding_piece_attack_table(position, bitboard_position, get_bishop_attacks)
+        elif piece_type == pieces.ROOK:
+            self.update_sliding_piece_attack_table(position, bitboard_position, get_rook_attacks)
+        elif piece_type == pieces.QUEEN:
+            self.update_sliding_piece_attack_table(position, bitboard_position, get_queen_attacks)
         else:
             self.update_king_attack_table(position, bitboard_position)
     
@@ -461,19 +447,12 @@ class Board:
                 self.attack_tables[bitboard_position] |= bitboard_position >> 7
             if DISTANCE_TO_EDGE[position][1] > 0:
                 self.attack_tables[bitboard_position] |= bitboard_position >> 9
-            
-            if self.attack_tables[bitboard_position] & self.pieces[pieces.BLACK] & self.pieces[pieces.KING] > 0:
-                self.moves_blocking_black_check = 0
-                self.pieces_attacking_black_king.append(bitboard_position)
         else:
             if DISTANCE_TO_EDGE[position][0] > 0:
                 self.attack_tables[bitboard_position] |= bitboard_position << 9
             if DISTANCE_TO_EDGE[position][1] > 0:
                 self.attack_tables[bitboard_position] |= bitboard_position << 7
-            
-            if self.attack_tables[bitboard_position] & self.pieces[pieces.WHITE] & self.pieces[pieces.KING] > 0:
-                self.moves_blocking_white_check = 0
-                self.pieces_attacking_white_king.append(bitboard_position)
+
     def update_knight_attack_table(self, position, bitboard_position):
         for move in KNIGHT_MOVES[position]:
             if move > 0:
@@ -483,50 +462,14 @@ class Board:
                 
             self.attack_tables[bitboard_position] |= target_bitboard_position
 
-        if self.attack_tables[bitboard_position] & self.pieces[pieces.BLACK] & self.pieces[pieces.KING] and self.is_white(bitboard_position):
-            self.moves_blocking_black_check = 0
-            self.pieces_attacking_black_king.append(bitboard_position)
-        elif self.attack_tables[bitboard_position] & self.pieces[pieces.WHITE] & self.pieces[pieces.KING] and self.is_black(bitboard_position):
-            self.moves_blocking_white_check = 0
-            self.pieces_attacking_white_king.append(bitboard_position)         
-    def update_sliding_piece_attack_table(self, position, bitboard_position, start_direction_offset_index, end_direction_offset_index):      
-        for direction_offset_index in range(start_direction_offset_index, end_direction_offset_index):
-            direction_offset = SLIDING_PIECE_DIRECTION_OFFSETS[direction_offset_index]
-            for i in range(DISTANCE_TO_EDGE[position][direction_offset_index]):
-                if direction_offset > 0:
-                    target_bitboard_position = bitboard_position << (direction_offset * (i+1))
-                else:
-                    target_bitboard_position = bitboard_position >> -(direction_offset * (i+1))
-
-                self.attack_tables[bitboard_position] |= target_bitboard_position
-
-                # If it finds a king, store moves that block the check
-                if self.is_king(target_bitboard_position):
-                    if self.is_white(bitboard_position) and self.is_black(target_bitboard_position):
-                        blocking_moves = 0
-                        for j in range(i):
-                            if direction_offset > 0:
-                                blocking_moves |= bitboard_position << (direction_offset * (j+1))
-                            else:
-                                blocking_moves |= bitboard_position >> -(direction_offset * (j+1))
-                        self.moves_blocking_black_check &= blocking_moves
-                        self.pieces_attacking_black_king.append(bitboard_position)
-                    elif self.is_black(bitboard_position) and self.is_white(target_bitboard_position):
-                        blocking_moves = 0
-                        for j in range(i):
-                            if direction_offset > 0:
-                                blocking_moves |= bitboard_position << (direction_offset * (j+1))
-                            else:
-                                blocking_moves |= bitboard_position >> -(direction_offset * (j+1))
-                        self.moves_blocking_white_check &= blocking_moves
-                        self.pieces_attacking_white_king.append(bitboard_position)
-                    else:
-                        break # Same colour, so can't move through them
-
-                elif self.is_piece(target_bitboard_position):
-                    if self.is_white(target_bitboard_position) != self.is_white(bitboard_position):
-                        self.check_pinned(position + direction_offset * (i+1), target_bitboard_position, direction_offset_index, bitboard_position)
-                    break   
+    def update_sliding_piece_attack_table(self, position, bitboard_position, get_attacks):
+        enemy_color = pieces.BLACK if self.is_white(bitboard_position) else pieces.WHITE
+        enemy_king = self.pieces[enemy_color] & self.pieces[pieces.KING]
+        occupancy = self.pieces[pieces.WHITE] | self.pieces[pieces.BLACK]
+
+        # Attacks go through the enemy king so it can't escape check along the attacking line
+        self.attack_tables[bitboard_position] = get_attacks(position, occupancy & ~enemy_king)
+
     def update_king_attack_table(self, position, bitboard_position):
         for move in KING_MOVES[position]:
             if move > 0:
@@ -534,55 +477,157 @@ class Board:
             else:
                 self.attack_tables[bitboard_position] |= bitboard_position >> -move
 
-    def check_pinned(self, position, bitboard_position, direction_offset_index, pinning_piece_bitboard_position):
-        direction_offset = SLIDING_PIECE_DIRECTION_OFFSETS[direction_offset_index]
-        opposite_direction_offset_index = direction_offset_index + 1 if direction_offset > 0 else direction_offset_index - 1
-        for i in range(DISTANCE_TO_EDGE[position][direction_offset_index]):
-            if direction_offset > 0:
-                target_bitboard_position = bitboard_position << (direction_offset * (i+1))
+    # -------------------------------- CHECKS + PINS --------------------------------
+
+    def update_checkers_and_pins(self):
+        # Checks and pins against the side to move, looked up outwards from its king once per position.
+        # checkers holds the pieces giving check, check_mask the squares a non-king move must land on,
+        # and pinned_pieces the friendly pieces that may only move along the line to their king
+        self.checkers = 0
+        self.check_mask = FULL_BOARD
+        self.pinned_pieces = 0
+
+        friendly_color = pieces.WHITE if self.white_to_move else pieces.BLACK
+        king = self.pieces[friendly_color] & self.pieces[pieces.KING]
+        if not king:
+            return
+        king_position = msb(king)
+
+        enemy_pieces = self.pieces[friendly_color ^ pieces.COLOR_MASK]
+        occupancy = self.pieces[pieces.WHITE] | self.pieces[pieces.BLACK]
+        diagonal_sliders = enemy_pieces & (self.pieces[pieces.BISHOP] | self.pieces[pieces.QUEEN])
+        orthogonal_sliders = enemy_pieces & (self.pieces[pieces.ROOK] | self.pieces[pieces.QUEEN])
+        pawn_attacks = WHITE_PAWN_ATTACKS if self.white_to_move else BLACK_PAWN_ATTACKS
+
+        checkers = enemy_pieces & (pawn_attacks[king_position] & self.pieces[pieces.PAWN] | KNIGHT_ATTACKS[king_position] & self.pieces[pieces.KNIGHT])
+
+        # Looking through friendly pieces finds every enemy slider lined up with the king, with nothing
+        # in between it gives check and with exactly one friendly piece in between that piece is pinned
+        snipers = get_bishop_attacks(king_position, enemy_pieces) & diagonal_sliders | get_rook_attacks(king_position, enemy_pieces) & orthogonal_sliders
+        for sniper_position in bitboard_to_positions(snipers):
+            blockers = BETWEEN[king_position][sniper_position] & occupancy
+            if blockers == 0:
+                checkers |= SQUARE_BB[sniper_position]
+            elif blockers & (blockers - 1) == 0:
+                self.pinned_pieces |= blockers
+
+        self.checkers = checkers
+        if checkers:
+            if checkers & (checkers - 1):
+                # Double check, only the king can move
+                self.check_mask = 0
             else:
-                target_bitboard_position = bitboard_position >> -(direction_offset * (i+1))
-
-            if self.is_king(target_bitboard_position):
-                if self.is_white(target_bitboard_position) == self.is_white(bitboard_position):
-                    pinned_pieces_moves = 0
-                    for j in range(i):
-                        if direction_offset > 0:
-                            pinned_pieces_moves |= bitboard_position << (direction_offset * (j+1))
-                        else:
-                            pinned_pieces_moves |= bitboard_position >> -(direction_offset * (j+1))
-                    for j in range(DISTANCE_TO_EDGE[int(math.log2(bitboard_position))][opposite_direction_offset_index]):
-                        if direction_offset > 0:
-                            target_pinned_piece_move = bitboard_position >> (direction_offset * (j+1))
-                        else:
-                            target_pinned_piece_move = bitboard_position << -(direction_offset * (j+1))
-                        
-                        if self.is_piece(target_pinned_piece_move):
-                            break
-
-                        pinned_pieces_moves |= target_pinned_piece_move
-
-                    if pinning_piece_bitboard_position in self.pinning_pieces:
-                        self.pinned_piece_moves.pop(self.pinning_pieces.pop(pinning_piece_bitboard_position))
-                    if bitboard_position in self.pinned_piece_moves:
-                        self.pinned_piece_moves.pop(self.pinning_pieces.pop(list(self.pinning_pieces.keys())[list(self.pinning_pieces.values()).index(bitboard_position)]))
-
-                    self.pinned_piece_moves[bitboard_position] = pinned_pieces_moves
-                    self.pinning_pieces[pinning_piece_bitboard_position] = bitboard_position
-                return
-    
+                self.check_mask = checkers | BETWEEN[king_position][msb(checkers)]
+
+    def is_legal(self, move):
+        # Whether a pseudo-legal move of the side to move keeps its king out of check, from the checkers and pins
+        start_position = get_start_position(move)
+        start_bitboard_position = SQUARE_BB[start_position]
+        end_bitboard_position = SQUARE_BB[get_end_position(move)]
+
+        if self.pieces[pieces.KING] & start_bitboard_position:
+            # Castling is only generated when legal, and the enemy attacks already go through the king
+            if move & (KINGSIDE_CASTLE_FLAG | QUEENSIDE_CASTLE_FLAG):
+                return True
+            enemy_attacks = self.black_pieces_attack_table if self.white_to_move else self.white_pieces_attack_table
+            return enemy_attacks & end_bitboard_position == 0
+
+        if move & EN_PASSANT_FLAG:
+            return self.is_legal_en_passant(start_bitboard_position)
+
+        if self.check_mask & end_bitboard_position == 0:
+            return False
+
+        if self.pinned_pieces & start_bitboard_position:
+            friendly_color = pieces.WHITE if self.white_to_move else pieces.BLACK
+            return LINE[msb(self.pieces[friendly_color] & self.pieces[pieces.KING])][start_position] & end_bitboard_position > 0
+
+        return True
+
+    def is_legal_en_passant(self, bitboard_position):
+        # En passant empties two squares at once, so it is checked on the position after the capture
+        if self.white_to_move:
+            friendly_color, enemy_color = pieces.WHITE, pieces.BLACK
+            captured_bitboard_position = self.en_passant_target << 8
+        else:
+            friendly_color, enemy_color = pieces.BLACK, pieces.WHITE
+            captured_bitboard_position = self.en_passant_target >> 8
+
+        # A knight check, or a pawn check from another pawn, isn't answered by taking en passant
+        if self.checkers & ~captured_bitboard_position & (self.pieces[pieces.PAWN] | self.pieces[pieces.KNIGHT]):
+            return False
+
+        king_position = msb(self.pieces[friendly_color] & self.pieces[pieces.KING])
+        occupancy = (self.pieces[pieces.WHITE] | self.pieces[pieces.BLACK]) ^ bitboard_position ^ captured_bitboard_position | self.en_passant_target
+        enemy_pieces = self.pieces[enemy_color]
+
+        if get_bishop_attacks(king_position, occupancy) & enemy_pieces & (self.pieces[pieces.BISHOP] | self.pieces[pieces.QUEEN]):
+            return False
+        if get_rook_attacks(king_position, occupancy) & enemy_pieces & (self.pieces[pieces.ROOK] | self.pieces[pieces.QUEEN]):
+            return False
+        return True
+
+    def get_attackers(self, position, occupancy):
+        # Pieces of both colors attacking a position, with the sliders looking through the given occupancy
+        return (BLACK_PAWN_ATTACKS[position] & self.pieces[pieces.WHITE] & self.pieces[pieces.PAWN]
+                | WHITE_PAWN_ATTACKS[position] & self.pieces[pieces.BLACK] & self.pieces[pieces.PAWN]
+                | KNIGHT_ATTACKS[position] & self.pieces[pieces.KNIGHT]
+                | KING_ATTACKS[position] & self.pieces[pieces.KING]
+                | get_bishop_attacks(position, occupancy) & (self.pieces[pieces.BISHOP] | self.pieces[pieces.QUEEN])
+                | get_rook_attacks(position, occupancy) & (self.pieces[pieces.ROOK] | self.pieces[pieces.QUEEN]))
+
+    def static_exchange_evaluation(self, move):
+        # Material the side to move wins with a capture or promotion once both sides have taken back on the square,
+        # least valuable piece first and each free to stop when taking back loses. Taking a piece off the occupancy
+        # lets the sliders behind it join in
+        start_position = get_start_position(move)
+        end_position = get_end_position(move)
+        occupancy = (self.pieces[pieces.WHITE] | self.pieces[pieces.BLACK]) ^ SQUARE_BB[start_position]
+
+        if move & EN_PASSANT_FLAG:
+            captured_value = CAPTURE_VALUES[pieces.PAWN]
+            occupancy ^= SQUARE_BB[end_position + 8] if self.white_to_move else SQUARE_BB[end_position - 8]
+        else:
+            captured_value = CAPTURE_VALUES[get_captured_piece(move) & pieces.TYPE_MASK]
+
+        piece_value = CAPTURE_VALUES[self.mailbox[start_position] & pieces.TYPE_MASK]
+        if move & PROMOTION_MASK:
+            captured_value += CAPTURE_VALUES[get_promotion_piece_type(move)] - piece_value
+            piece_value = CAPTURE_VALUES[get_promotion_piece_type(move)]
+
+        gains = [captured_value]
+        color = pieces.BLACK if self.white_to_move else pieces.WHITE
+        attackers = self.get_attackers(end_position, occupancy) & occupancy
+
+        while attackers & self.pieces[color]:
+            color_attackers = attackers & self.pieces[color]
+            for piece_type in range(pieces.PAWN, pieces.KING + 1):
+                piece_attackers = color_attackers & self.pieces[piece_type]
+                if piece_attackers:
+                    break
+
+            # The king can only take back on an undefended square
+            if piece_type == pieces.KING and attackers & self.pieces[color ^ pieces.COLOR_MASK]:
+                break
+
+            gains.append(piece_value - gains[-1])
+            piece_value = CAPTURE_VALUES[piece_type]
+            occupancy ^= piece_attackers & -piece_attackers
+            attackers = self.get_attackers(end_position, occupancy) & occupancy
+            color ^= pieces.COLOR_MASK
+
+        # Going back from the last capture, a side only takes back if that beats stopping
+        for index in range(len(gains) - 1, 0, -1):
+            gains[index-1] = min(gains[index-1], -gains[index])
+        return gains[0]
+
     # -------------------------------- UTILITES + PROPERTIES --------------------------------
 
     def get_piece_color(self, bitboard_position):
         if self.is_white(bitboard_position): return pieces.WHITE
         return pieces.BLACK
     def get_piece_type(self, bitboard_position):
-        if self.is_pawn(bitboard_position): return pieces.PAWN
-        if self.is_knight(bitboard_position): return pieces.KNIGHT
-        if self.is_bishop(bitboard_position): return pieces.BISHOP
-        if self.is_rook(bitboard_position): return pieces.ROOK
-        if self.is_queen(bitboard_position): return pieces.QUEEN
-        if self.is_king(bitboard_position): return pieces.KING
+        return self.mailbox[msb(bitboard_position)] & pieces.TYPE_MASK or None
     
     def is_piece(self, bitboard_position):
         return bitboard_position & (self.pieces[pieces.WHITE] | self.pieces[pieces.BLACK]) > 0   
@@ -605,106 +650,27 @@ class Board:
         return self.pieces[pieces.KING] & bitboard_position > 0
 
     def is_pinned(self, bitboard_position):
-        return bitboard_position in self.pinned_piece_moves and self.pinned_piece_moves[bitboard_position] & (self.pieces[pieces.WHITE] | self.pieces[pieces.BLACK]) == 0
-
+        return self.pinned_pieces & bitboard_position > 0
 
-    def bitboard_to_bitboard_positions(self, bitboard):
-        bitboard_string = bin(bitboard)[:1:-1]
-        i = bitboard_string.find('1')
-        while i != -1:
-            yield (i, 2**i)
-            i = bitboard_string.find('1', i+1)
 
     def get_bitboard_position_from_index(self, index: int):
-        return 0b1 << index
-
-    @property
-    def white_to_move(self):
-        return self.game_data & 0b10000000 > 0
-    @white_to_move.setter
-    def white_to_move(self, value):
-        if value and not self.game_data & 0b10000000:
-            self.game_data += 0b10000000
-        elif not value and self.game_data & 0b10000000:
-            self.game_data -= 0b10000000
-    
-    @property
-    def white_pieces_attack_table(self):
-        attacks = 0
-        for piece in self.bitboard_to_bitboard_positions(self.pieces[pieces.WHITE]):
-            attacks |= self.attack_tables[piece[1]]
-        return attacks   
-    @property
-    def black_pieces_attack_table(self):
-        attacks = 0
-        for piece in self.bitboard_to_bitboard_positions(self.pieces[pieces.BLACK]):
-            attacks |= self.attack_tables[piece[1]]
-        return attacks
-    
-    @property
-    def white_in_check(self):
-        return self.pieces[pieces.WHITE] & self.pieces[pieces.KING] & self.black_pieces_attack_table > 0     
-    @property
-    def black_in_check(self):
-        return self.pieces[pieces.BLACK] & self.pieces[pieces.KING] & self.white_pieces_attack_table > 0
-    @property
-    def player_in_check(self):
-        return self.white_in_check or self.black_in_check
+        return SQUARE_BB[index]
+    def get_bitboard_position_from_square(self, square):
+        return 0b1 << (8 - int(square[1])) * 8 + 'abcdefgh'.index(square[0])
 
     @property
     def white_can_kingside_castle(self):
-        return self.game_data & 0b10000 > 0 
-    @white_can_kingside_castle.setter
-    def white_can_kingside_castle(self, value):
-        if value and not self.game_data & 0b10000:
-            self.game_data += 0b10000
-        elif not value and self.game_data & 0b10000:
-            self.game_data -= 0b10000 
-    
+        return self.castling_rules & WHITE_KINGSIDE_CASTLE > 0
     @property
     def white_can_queenside_castle(self):
-        return self.game_data & 0b1000 > 0 
-    @white_can_queenside_castle.setter
-    def white_can_queenside_castle(self, value):
-        if value and not self.game_data & 0b1000:
-            self.game_data += 0b1000
-        elif not value and self.game_data & 0b1000:
-            self.game_data -= 0b1000 
-    
+        return self.castling_rules & WHITE_QUEENSIDE_CASTLE > 0
     @property
     def black_can_kingside_castle(self):
-        return self.game_data & 0b100 > 0   
-    @black_can_kingside_castle.setter
-    def black_can_kingside_castle(self, value):
-        if value and not self.game_data & 0b100:
-            self.game_data += 0b100
-        elif not value and self.game_data & 0b100:
-            self.game_data -= 0b100 
-    
+        return self.castling_rules & BLACK_KINGSIDE_CASTLE > 0
     @property
     def black_can_queenside_castle(self):
-        return self.game_data & 0b10 > 0 
-    @black_can_queenside_castle.setter
-    def black_can_queenside_castle(self, value):
-        if value and not self.game_data & 0b10:
-            self.game_data += 0b10
-        elif not value and self.game_data & 0b10:
-            self.game_data -= 0b10
-
-    @property
-    def castling_rules(self):
-        return self.game_data & 0b11110
-    @castling_rules.setter
-    def castling_rules(self, value):
-        self.game_data |= value
-
+        return self.castling_rules & BLACK_QUEENSIDE_CASTLE > 0
+    
     @property
-    def is_en_passant_target(self):
-        return self.game_data & 0b1 > 0  
-    @is_en_passant_target.setter
-    def is_en_passant_target(self, value):
-        if value and not self.game_data & 0b1:
-            self.game_data += 0b1
-        elif not value and self.game_data & 0b1:
-            self.game_data -= 0b1
-    
\ No newline at end of file
+    def is_threefold_repetition(self):
+        return self.position_counts[self.zobrist_key] >= 3
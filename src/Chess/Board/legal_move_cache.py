@@ -0,0 +1,47 @@
+from collections import OrderedDict
+
+from Chess.Board.move import get_start_position
+from Chess.Board.move_generator import MoveGenerator
+
+LEGAL_MOVE_CACHE_SIZE = 64
+
+class LegalMoveCache:
+    # Legal moves of recently seen positions by zobrist key, the least recently used position is dropped first.
+    # make_move and undo_move change the key, so a stale list is never returned and nothing has to be invalidated
+    def __init__(self, board, size = LEGAL_MOVE_CACHE_SIZE):
+        self.board = board
+        self.move_generator = MoveGenerator(board)
+        self.size = size
+
+        self.legal_moves = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get_legal_moves(self):
+        # Shared between callers, so a tuple rather than a list
+        # Repetition isn't part of the key, a threefold position is never cached
+        if self.board.is_threefold_repetition:
+            return ()
+
+        key = self.board.zobrist_key
+        legal_moves = self.legal_moves.get(key)
+
+        if legal_moves is None:
+            self.misses += 1
+            legal_moves = tuple(self.move_generator.get_legal_moves())
+            self.legal_moves[key] = legal_moves
+            if len(self.legal_moves) > self.size:
+                self.legal_moves.popitem(last = False)
+        else:
+            self.hits += 1
+            self.legal_moves.move_to_end(key)
+
+        return legal_moves
+
+    def get_piece_legal_moves(self, position):
+        return [move for move in self.get_legal_moves() if get_start_position(move) == position]
+
+    def clear(self):
+        self.legal_moves.clear()
+        self.hits = 0
+        self.misses = 0
@@ -0,0 +1,63 @@
+from Chess.Board.pre_computed_data import DIRECTION_OFFSETS, RAY
+
+# Sliding piece attack lookup. Every square has a mask of the squares whose occupancy
+# can change its attacks (the rays without the board edge) and a table mapping each
+# subset of that mask straight to the attack bitboard, so an attack lookup is a single
+# AND and a single index: ROOK_ATTACKS[square][occupancy & ROOK_MASKS[square]].
+#
+# This is the perfect hash a magic multiply would give in C. In python the masked
+# occupancy is already a cheap dict key, so the multiply and shift are skipped.
+
+# Indices into DIRECTION_OFFSETS
+BISHOP_DIRECTIONS = [ 4, 5, 6, 7 ]
+ROOK_DIRECTIONS = [ 0, 1, 2, 3 ]
+
+def generate_sliding_attacks(square, occupancy, directions):
+    attacks = 0
+    for direction in directions:
+        attacks |= RAY[direction][square]
+        blockers = RAY[direction][square] & occupancy
+        if blockers:
+            # The nearest blocker is the lowest set bit going up the board index and the highest going down
+            if DIRECTION_OFFSETS[direction] > 0:
+                blocker = (blockers & -blockers).bit_length() - 1
+            else:
+                blocker = blockers.bit_length() - 1
+            attacks ^= RAY[direction][blocker]
+    return attacks
+
+def generate_relevant_occupancy_mask(square, directions):
+    mask = 0
+    for direction in directions:
+        ray = RAY[direction][square]
+        # The last square of a ray is always attacked, whatever is on it
+        if DIRECTION_OFFSETS[direction] > 0:
+            mask |= ray & ~(1 << (ray.bit_length() - 1)) if ray else 0
+        else:
+            mask |= ray & (ray - 1)
+    return mask
+
+def generate_attack_table(square, mask, directions):
+    table = {}
+    # Carry-rippler trick to enumerate every subset of the mask
+    occupancy = 0
+    while True:
+        table[occupancy] = generate_sliding_attacks(square, occupancy, directions)
+        occupancy = (occupancy - mask) & mask
+        if occupancy == 0:
+            return table
+
+BISHOP_MASKS = [generate_relevant_occupancy_mask(square, BISHOP_DIRECTIONS) for square in range(64)]
+ROOK_MASKS = [generate_relevant_occupancy_mask(square, ROOK_DIRECTIONS) for square in range(64)]
+
+BISHOP_ATTACKS = [generate_attack_table(square, BISHOP_MASKS[square], BISHOP_DIRECTIONS) for square in range(64)]
+ROOK_ATTACKS = [generate_attack_table(square, ROOK_MASKS[square], ROOK_DIRECTIONS) for square in range(64)]
+
+def get_bishop_attacks(square, occupancy):
+    return BISHOP_ATTACKS[square][occupancy & BISHOP_MASKS[square]]
+
+def get_rook_attacks(square, occupancy):
+    return ROOK_ATTACKS[square][occupancy & ROOK_MASKS[square]]
+
+def get_queen_attacks(square, occupancy):
+    return BISHOP_ATTACKS[square][occupancy & BISHOP_MASKS[square]] | ROOK_ATTACKS[square][occupancy & ROOK_MASKS[square]]
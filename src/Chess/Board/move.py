@@ -1,28 +1,96 @@
 from Chess.Board import pieces
 
+# Moves are plain ints so generating and searching them allocates nothing:
+# Bit 0: en passant
+# Bits 1-3: promotion, knight to queen numbered 1 to 4
+# Bit 4: queenside castle
+# Bit 5: kingside castle
+# Bits 6-10: captured piece (color | type)
+# Bit 11: white to move
+# Bits 12-17: start position
+# Bits 18-23: end position
+
+EN_PASSANT_FLAG = 0b1
+PROMOTION_MASK = 0b1110
+QUEENSIDE_CASTLE_FLAG = 0b10000
+KINGSIDE_CASTLE_FLAG = 0b100000
+CAPTURE_MASK = 0b11111000000
+WHITE_TO_MOVE_FLAG = 0b100000000000
+MOVE_DATA_MASK = 0b111111111111
+
+START_POSITION_SHIFT = 12
+END_POSITION_SHIFT = 18
+POSITION_MASK = 0b111111
+
+CAPTURE_VALUES = [0] * (pieces.KING + 1)
+CAPTURE_VALUES[pieces.PAWN] = 100
+CAPTURE_VALUES[pieces.KNIGHT] = 300
+CAPTURE_VALUES[pieces.BISHOP] = 330
+CAPTURE_VALUES[pieces.ROOK] = 500
+CAPTURE_VALUES[pieces.QUEEN] = 900
+
+def encode_move(start_position, end_position, move_data):
+    return move_data | start_position << START_POSITION_SHIFT | end_position << END_POSITION_SHIFT
+
+def get_start_position(move):
+    return move >> START_POSITION_SHIFT & POSITION_MASK
+def get_end_position(move):
+    return move >> END_POSITION_SHIFT & POSITION_MASK
+def get_move_data(move):
+    return move & MOVE_DATA_MASK
+
+def is_white_move(move):
+    return move & WHITE_TO_MOVE_FLAG > 0
+def is_capture(move):
+    return move & CAPTURE_MASK > 0
+def get_captured_piece(move):
+    return move >> 6 & 0b11111
+def get_capture_value(move):
+    return CAPTURE_VALUES[move >> 6 & 0b111]
+
+def is_kingside_castle(move):
+    return move & KINGSIDE_CASTLE_FLAG > 0
+def is_queenside_castle(move):
+    return move & QUEENSIDE_CASTLE_FLAG > 0
+
+def is_promotion(move):
+    return move & PROMOTION_MASK > 0
+def get_promotion_piece_type(move):
+    # Promotions are numbered knight to queen, one below the piece constants
+    return (move >> 1 & 0b111) + 1
+def is_en_passant(move):
+    return move & EN_PASSANT_FLAG > 0
+
 class Move:
-    def __init__(self, start_position, end_position, move_data, previous_castling_rules, previous_en_passant_target):
-        self.start_position = start_position
-        self.end_position = end_position
+    # Read-only view of a packed move for the UI, the board and search use the int directly
+    __slots__ = ('move',)
+
+    def __init__(self, move):
+        self.move = move
+
+    @property
+    def start_position(self):
+        return self.move >> START_POSITION_SHIFT & POSITION_MASK
+    @property
+    def end_position(self):
+        return self.move >> END_POSITION_SHIFT & POSITION_MASK
+    @property
+    def move_data(self):
+        return self.move & MOVE_DATA_MASK
 
-        self.move_data = move_data
-        
-        self.previous_castling_rules = previous_castling_rules
-        self.previous_en_passant_target = previous_en_passant_target
-    
     @property
     def is_white_to_move(self):
         return self.move_data & 0b100000000000 > 0
     @property
     def is_capture(self):
         return self.move_data & 0b1111000000 > 0
-    
+
     @property
     def captured_white(self):
         return self.move_data & pieces.WHITE << 6 > 0
     @property
     def captured_pawn(self):
-        return self.move_data & 0b000111000000 == pieces.PAWN << 6 
+        return self.move_data & 0b000111000000 == pieces.PAWN << 6
     @property
     def captured_knight(self):
         return self.move_data & 0b000111000000 == pieces.KNIGHT << 6
@@ -37,31 +105,27 @@ class Move:
         return self.move_data & 0b000111000000 == pieces.QUEEN << 6
     @property
     def captured_king(self):
-        return self.move_data & 0b000111000000 == pieces.KING << 6 
+        return self.move_data & 0b000111000000 == pieces.KING << 6
+    @property
+    def captured_piece(self):
+        return self.move_data >> 6 & 0b11111
     @property
     def capture_value(self):
-        if self.captured_pawn:
-            return 100
-        if self.captured_knight:
-            return 300
-        if self.captured_bishop:
-            return 330
-        if self.captured_rook:
-            return 500
-        if self.captured_queen:
-            return 900
-        return 0
-    
+        return get_capture_value(self.move)
+
     @property
     def is_kingside_castle(self):
-        return self.move_data & 0b100000 > 0   
+        return self.move_data & 0b100000 > 0
     @property
     def is_queenside_castle(self):
         return self.move_data & 0b10000 > 0
-    
+
     @property
     def is_promotion(self):
-        return self.move_data & 0b1110 > 0   
+        return self.move_data & 0b1110 > 0
+    @property
+    def promotion_piece_type(self):
+        return get_promotion_piece_type(self.move)
     @property
     def is_promotion_to_knight(self):
         return self.move_data & 0b1110 == 0b10
@@ -76,4 +140,4 @@ class Move:
         return self.move_data & 0b1110 == 0b1000
     @property
     def is_en_passant(self):
-        return self.move_data & 0b1 > 0
\ No newline at end of file
+        return self.move_data & 0b1 > 0
@@ -1,106 +1,406 @@
 from Chess.Board import pieces
-from Chess.Board.move import Move
+from Chess.Board.move import WHITE_TO_MOVE_FLAG, START_POSITION_SHIFT, END_POSITION_SHIFT, EN_PASSANT_FLAG, PROMOTION_MASK, CAPTURE_MASK, CAPTURE_VALUES, get_start_position, get_end_position, get_captured_piece, get_promotion_piece_type
+from Chess.Board.board import WHITE_KINGSIDE_CASTLE, WHITE_QUEENSIDE_CASTLE, BLACK_KINGSIDE_CASTLE, BLACK_QUEENSIDE_CASTLE, FULL_BOARD
+from Chess.Board.bitops import SQUARE_BB, msb, popcount, bitboard_to_positions, bitboard_to_bitboard_positions
+from Chess.Board.pre_computed_data import LINE, KNIGHT_ATTACKS, WHITE_PAWN_ATTACKS, BLACK_PAWN_ATTACKS, MOVE_TEMPLATES
+from Chess.Board.magic_bitboards import get_bishop_attacks, get_rook_attacks
 
-import time
+from array import array
+
+# Most legal moves any position can have is 218
+MAX_MOVES = 256
+MAX_PLY = 64
+
+# Pawn moves onto these squares are promotions and are generated with the captures
+PROMOTION_RANKS = 0xFF | 0xFF << 56
+
+FILE_A = 0x0101010101010101
+FILE_H = 0x8080808080808080
+WHITE_PAWN_START_RANK = 0xFF << 48
+BLACK_PAWN_START_RANK = 0xFF << 8
+# Squares a single push from the start rank lands on, the pawns there may push again
+WHITE_DOUBLE_PUSH_RANK = 0xFF << 40
+BLACK_DOUBLE_PUSH_RANK = 0xFF << 16
+
+# Captures that give up material are scored below this so they sort after every other capture
+LOSING_CAPTURE_SCORE = -1_000_000
+# Spreads the most valuable victim, least valuable attacker scores apart enough to fit any exchange value in between
+EXCHANGE_TIE_BREAK_SCALE = 4096
+# History tables hold one entry per start and end position for each color
+HISTORY_COLOR_OFFSET = 64 * 64
+HISTORY_SIZE = 2 * HISTORY_COLOR_OFFSET
+
+class MoveBuffers:
+    # One move array and a parallel score array per search ply, allocated once and refilled at every node
+    def __init__(self, max_ply = MAX_PLY):
+        self.moves = [array('I', [0]) * MAX_MOVES for _ in range(max_ply)]
+        self.scores = [array('i', [0]) * MAX_MOVES for _ in range(max_ply)]
 
 class MoveGenerator:
     def __init__(self, board):
         self.board = board
     
     def get_legal_moves(self):
-        if self.board.previous_positions.count(self.board.zobrist_key) >= 3:
-            return []
+        moves = array('I', [0]) * MAX_MOVES
+        count = self.generate_legal_moves(moves)
+        return moves[:count].tolist()
 
-        moves = []
+    def generate_legal_moves(self, moves, count = 0, targets = FULL_BOARD, pawn_targets = FULL_BOARD):
+        # Writes the legal moves landing on targets (pawn_targets for pawns) into moves from index count
+        # and returns the new count
+        if self.board.is_threefold_repetition:
+            return count
+
+        if self.board.checkers:
+            return self.generate_evasions(moves, count, targets, pawn_targets)
 
         if self.board.white_to_move:
             pieces_bitboard = self.board.pieces[pieces.WHITE]
         else:
             pieces_bitboard = self.board.pieces[pieces.BLACK]
-        
-        pieces_list = self.board.bitboard_to_bitboard_positions(pieces_bitboard)
 
-        for piece in pieces_list:
-            moves += self.get_piece_legal_moves(piece)
+        # Unpinned pawns are generated all at once, everything else a piece at a time
+        setwise_pawns = pieces_bitboard & self.board.pieces[pieces.PAWN] & ~self.board.pinned_pieces
 
-        return moves
+        for piece in bitboard_to_bitboard_positions(pieces_bitboard ^ setwise_pawns):
+            count = self.add_piece_legal_moves(piece, moves, count, targets, pawn_targets)
 
-    def get_piece_legal_moves(self, piece):
-        
-        start_time = time.perf_counter()
+        return self.add_pawn_moves(setwise_pawns, moves, count, pawn_targets)
+
+    def generate_evasions(self, moves, count = 0, targets = FULL_BOARD, pawn_targets = FULL_BOARD):
+        # Moves out of check. In double check only the king can move, otherwise the other pieces can only capture the
+        # checker or block on the squares between it and the king, so the work starts from those few squares and looks
+        # back for pieces that reach them. A pinned piece can never do either
+        board = self.board
+        friendly_color = pieces.WHITE if board.white_to_move else pieces.BLACK
+        king = board.pieces[friendly_color] & board.pieces[pieces.KING]
+
+        count = self.add_piece_legal_moves((msb(king), king), moves, count, targets)
+
+        if board.checkers & (board.checkers - 1):
+            return count
+
+        occupancy = board.pieces[pieces.WHITE] | board.pieces[pieces.BLACK]
+        defenders = board.pieces[friendly_color] & ~board.pinned_pieces
+        knights = defenders & board.pieces[pieces.KNIGHT]
+        diagonal_sliders = defenders & (board.pieces[pieces.BISHOP] | board.pieces[pieces.QUEEN])
+        orthogonal_sliders = defenders & (board.pieces[pieces.ROOK] | board.pieces[pieces.QUEEN])
+
+        for end_position in bitboard_to_positions(board.check_mask & targets):
+            attackers = KNIGHT_ATTACKS[end_position] & knights | get_bishop_attacks(end_position, occupancy) & diagonal_sliders | get_rook_attacks(end_position, occupancy) & orthogonal_sliders
+            for start_position in bitboard_to_positions(attackers):
+                moves[count] = self.get_move_data(start_position, end_position)
+                count += 1
+
+        # add_pawn_moves already keeps to the check mask
+        return self.add_pawn_moves(defenders & board.pieces[pieces.PAWN], moves, count, pawn_targets)
+
+    def add_pawn_moves(self, pawns, moves, count, targets = FULL_BOARD, pseudo_legal = False):
+        pawn_moves, en_passant_moves = self.get_pawn_moves_bitboards(pawns, targets, pseudo_legal)
+        move_data = WHITE_TO_MOVE_FLAG if self.board.white_to_move else 0
+
+        mailbox = self.board.mailbox
+        for destinations, start_offset in pawn_moves:
+            for end_position in bitboard_to_positions(destinations):
+                move = move_data | mailbox[end_position] << 6 | end_position + start_offset << START_POSITION_SHIFT | end_position << END_POSITION_SHIFT
+                if SQUARE_BB[end_position] & PROMOTION_RANKS:
+                    for promotion in range(1, 5):
+                        moves[count] = move | promotion << 1
+                        count += 1
+                else:
+                    moves[count] = move
+                    count += 1
+
+        for start_position, end_position in en_passant_moves:
+            moves[count] = move_data | EN_PASSANT_FLAG | start_position << START_POSITION_SHIFT | end_position << END_POSITION_SHIFT
+            count += 1
+
+        return count
+
+    def get_pawn_moves_bitboards(self, pawns, targets = FULL_BOARD, pseudo_legal = False):
+        # Every kind of pawn move is one shift of the whole pawn bitboard, shifting the destination back gives the start
+        # square. Only legal for pawns that aren't pinned, en passant still has its own legality check.
+        # Returns (destinations, start offset) pairs and the legal en passant captures as (start, end) pairs
+        board = self.board
+        empty = FULL_BOARD ^ (board.pieces[pieces.WHITE] | board.pieces[pieces.BLACK])
+        en_passant_targets = board.en_passant_target & targets
+        targets &= board.check_mask
+
+        if board.white_to_move:
+            enemy_pieces = board.pieces[pieces.BLACK]
+            single_pushes = pawns >> 8 & empty
+            pawn_moves = (
+                (single_pushes, 8),
+                ((single_pushes & WHITE_DOUBLE_PUSH_RANK) >> 8 & empty, 16),
+                ((pawns & ~FILE_A) >> 9 & enemy_pieces, 9),
+                ((pawns & ~FILE_H) >> 7 & enemy_pieces, 7)
+            )
+            en_passant_capturers = BLACK_PAWN_ATTACKS
+        else:
+            enemy_pieces = board.pieces[pieces.WHITE]
+            single_pushes = pawns << 8 & empty
+            pawn_moves = (
+                (single_pushes, -8),
+                ((single_pushes & BLACK_DOUBLE_PUSH_RANK) << 8 & empty, -16),
+                ((pawns & ~FILE_A) << 7 & enemy_pieces, -7),
+                ((pawns & ~FILE_H) << 9 & enemy_pieces, -9)
+            )
+            en_passant_capturers = WHITE_PAWN_ATTACKS
+
+        pawn_moves = [(destinations & targets, start_offset) for destinations, start_offset in pawn_moves]
+
+        en_passant_moves = []
+        if en_passant_targets:
+            end_position = msb(en_passant_targets)
+            for start_position in bitboard_to_positions(en_passant_capturers[end_position] & pawns):
+                if pseudo_legal or self.board.is_legal_en_passant(SQUARE_BB[start_position]):
+                    en_passant_moves.append((start_position, end_position))
+
+        return pawn_moves, en_passant_moves
+
+    def count_legal_moves(self):
+        # Same moves as generate_legal_moves, counted straight from the destination bitboards without encoding any
+        if self.board.is_threefold_repetition:
+            return 0
+
+        if self.board.white_to_move:
+            pieces_bitboard = self.board.pieces[pieces.WHITE]
+        else:
+            pieces_bitboard = self.board.pieces[pieces.BLACK]
+
+        setwise_pawns = pieces_bitboard & self.board.pieces[pieces.PAWN] & ~self.board.pinned_pieces
+
+        count = 0
+        for piece in bitboard_to_bitboard_positions(pieces_bitboard ^ setwise_pawns):
+            moves_bitboard = self.get_piece_legal_moves_bitboard(piece)
+            count += popcount(moves_bitboard)
+            if piece[1] & self.board.pieces[pieces.PAWN]:
+                # Each promotion is four moves
+                count += 3 * popcount(moves_bitboard & PROMOTION_RANKS)
+
+        pawn_moves, en_passant_moves = self.get_pawn_moves_bitboards(setwise_pawns)
+        for destinations, _ in pawn_moves:
+            count += popcount(destinations) + 3 * popcount(destinations & PROMOTION_RANKS)
+
+        return count + len(en_passant_moves)
+
+    def get_legal_captures(self):
+        moves = array('I', [0]) * MAX_MOVES
+        count = self.generate_legal_captures(moves, under_promotions = False)
+        return moves[:count].tolist()
+
+    def generate_pseudo_legal_moves(self, moves, count = 0, targets = FULL_BOARD, pawn_targets = FULL_BOARD):
+        # Moves that follow how the pieces move but may leave the king in check, Board.is_legal settles that
+        # for the moves search actually tries. In check the evasions are generated, there are few and they're legal
+        if self.board.is_threefold_repetition:
+            return count
+
+        if self.board.checkers:
+            return self.generate_evasions(moves, count, targets, pawn_targets)
+
+        friendly_pieces = self.board.pieces[pieces.WHITE] if self.board.white_to_move else self.board.pieces[pieces.BLACK]
+        friendly_pawns = friendly_pieces & self.board.pieces[pieces.PAWN]
+
+        for position, bitboard_position in bitboard_to_bitboard_positions(friendly_pieces ^ friendly_pawns):
+            moves_bitboard = self.board.attack_tables[bitboard_position] & ~friendly_pieces
+            if self.board.pieces[pieces.KING] & bitboard_position:
+                # Castling is only ever generated legal
+                moves_bitboard |= self.get_king_legal_moves(bitboard_position)
+            count = self.add_moves(position, bitboard_position, moves_bitboard & targets, moves, count)
+
+        return self.add_pawn_moves(friendly_pawns, moves, count, pawn_targets, pseudo_legal = True)
+
+    def generate_legal_captures(self, moves, count = 0, under_promotions = True, pseudo_legal = False):
+        # Captures, en passant and promotions, only the targets in reach of a capture are looked at
+        generate_moves = self.generate_pseudo_legal_moves if pseudo_legal else self.generate_legal_moves
+        enemy_pieces = self.board.pieces[pieces.BLACK] if self.board.white_to_move else self.board.pieces[pieces.WHITE]
+        capture_count = generate_moves(moves, count, enemy_pieces, enemy_pieces | self.board.en_passant_target | PROMOTION_RANKS)
+
+        if under_promotions:
+            return capture_count
+
+        # Quiescence only needs the queen out of the quiet promotions
+        for index in range(count, capture_count):
+            move = moves[index]
+            if move & CAPTURE_MASK or move & PROMOTION_MASK == 0 or get_promotion_piece_type(move) == pieces.QUEEN:
+                moves[count] = move
+                count += 1
+        return count
+
+    def generate_legal_quiets(self, moves, count = 0, pseudo_legal = False):
+        # Every move generate_legal_captures leaves out
+        generate_moves = self.generate_pseudo_legal_moves if pseudo_legal else self.generate_legal_moves
+        enemy_pieces = self.board.pieces[pieces.BLACK] if self.board.white_to_move else self.board.pieces[pieces.WHITE]
+        return generate_moves(moves, count, FULL_BOARD ^ enemy_pieces, FULL_BOARD ^ (enemy_pieces | self.board.en_passant_target | PROMOTION_RANKS))
 
-        if self.board.previous_positions.count(self.board.zobrist_key) >= 3:
+    def generate_staged_moves(self, moves, scores, hash_move = 0, killers = (), pseudo_legal = False, history = None):
+        # Yields the legal moves one stage at a time: the hash move, winning captures, killers, quiet moves
+        # best history first and losing captures. A stage is only generated once search has gone through the ones before it,
+        # so a cutoff on an early move skips the rest of the work. With pseudo_legal the captures and quiet
+        # moves still need Board.is_legal, the hash move and killers are always checked here
+        if self.board.is_threefold_repetition:
+            return
+
+        if hash_move and self.is_legal_move(hash_move, moves):
+            yield hash_move
+        else:
+            hash_move = 0
+
+        capture_count = self.generate_legal_captures(moves, pseudo_legal = pseudo_legal)
+        self.score_captures(moves, scores, capture_count)
+
+        index = 0
+        while index < capture_count:
+            move = pick_move(moves, scores, index, capture_count)
+            if scores[index] <= LOSING_CAPTURE_SCORE:
+                break
+            index += 1
+            if move != hash_move:
+                yield move
+        losing_captures_index = index
+
+        searched_killers = []
+        for killer in killers:
+            if killer and killer != hash_move and killer not in searched_killers and killer & (CAPTURE_MASK | EN_PASSANT_FLAG | PROMOTION_MASK) == 0 and self.is_legal_move(killer, moves, capture_count):
+                searched_killers.append(killer)
+                yield killer
+
+        move_count = self.generate_legal_quiets(moves, capture_count, pseudo_legal)
+        if history is not None:
+            self.score_quiets(moves, scores, capture_count, move_count, history)
+        for index in range(capture_count, move_count):
+            move = moves[index] if history is None else pick_move(moves, scores, index, move_count)
+            if move != hash_move and move not in searched_killers:
+                yield move
+
+        for index in range(losing_captures_index, capture_count):
+            move = pick_move(moves, scores, index, capture_count)
+            if move != hash_move:
+                yield move
+
+    def score_quiets(self, moves, scores, start, count, history):
+        # History is indexed by color then by the start and end positions, the bits of the move above its data
+        color_offset = HISTORY_COLOR_OFFSET if self.board.white_to_move else 0
+        for index in range(start, count):
+            scores[index] = history[color_offset | moves[index] >> START_POSITION_SHIFT]
+
+    def score_captures(self, moves, scores, count):
+        # Most valuable victim, least valuable attacker, with the static exchange evaluation breaking ties.
+        # A capture that loses material once the exchange is played out is losing, the least bad first
+        for index in range(count):
+            move = moves[index]
+            victim_value = CAPTURE_VALUES[get_captured_piece(move) & pieces.TYPE_MASK]
+            # En passant has no captured piece in the move, it always takes a pawn
+            if move & EN_PASSANT_FLAG:
+                victim_value = CAPTURE_VALUES[pieces.PAWN]
+            if move & PROMOTION_MASK:
+                victim_value += CAPTURE_VALUES[get_promotion_piece_type(move)]
+            attacker_value = CAPTURE_VALUES[self.board.mailbox[get_start_position(move)] & pieces.TYPE_MASK]
+
+            exchange_value = self.board.static_exchange_evaluation(move)
+            if exchange_value < 0:
+                scores[index] = LOSING_CAPTURE_SCORE + exchange_value
+            else:
+                scores[index] = (10 * victim_value - attacker_value) * EXCHANGE_TIE_BREAK_SCALE + exchange_value
+
+    def is_legal_move(self, move, moves, count = 0):
+        # Whether a move from somewhere else (the transposition table, a killer slot) is legal here. Only the
+        # moving piece's moves are generated, into moves past count
+        start_position = get_start_position(move)
+        friendly_pieces = self.board.pieces[pieces.WHITE] if self.board.white_to_move else self.board.pieces[pieces.BLACK]
+        if not friendly_pieces & SQUARE_BB[start_position]:
+            return False
+
+        move_count = self.add_piece_legal_moves((start_position, SQUARE_BB[start_position]), moves, count)
+        for index in range(count, move_count):
+            if moves[index] == move:
+                return True
+        return False
+
+    def get_piece_legal_moves(self, piece):
+        if self.board.is_threefold_repetition:
             return []
 
+        moves = array('I', [0]) * MAX_MOVES
+        count = self.add_piece_legal_moves(piece, moves, 0)
+        return moves[:count].tolist()
+
+    def has_legal_move(self):
+        # Stops at the first piece with somewhere to go, the king first as it is the only piece that can move in double check
+        if self.board.is_threefold_repetition:
+            return False
+
+        friendly_color = pieces.WHITE if self.board.white_to_move else pieces.BLACK
+        king = self.board.pieces[friendly_color] & self.board.pieces[pieces.KING]
+        if king and self.get_king_legal_moves(king):
+            return True
+
+        for piece in bitboard_to_bitboard_positions(self.board.pieces[friendly_color] & ~king):
+            if self.get_piece_legal_moves_bitboard(piece):
+                return True
+        return False
+
+    def add_piece_legal_moves(self, piece, moves, count, targets = FULL_BOARD, pawn_targets = FULL_BOARD):
+        if self.board.is_pawn(piece[1]):
+            moves_bitboard = self.get_piece_legal_moves_bitboard(piece) & pawn_targets
+        else:
+            moves_bitboard = self.get_piece_legal_moves_bitboard(piece) & targets
+
+        return self.add_moves(piece[0], piece[1], moves_bitboard, moves, count)
+
+    def get_piece_legal_moves_bitboard(self, piece):
         position, bitboard_position = piece[0], piece[1]
 
         if self.board.is_pawn(bitboard_position):
-            moves_bitboard = self.get_pawn_legal_moves(position, bitboard_position)
-            moves = self.moves_bitboard_to_moves(position, bitboard_position, moves_bitboard)
-            return moves
+            return self.get_pawn_legal_moves(position, bitboard_position)
         if self.board.is_king(bitboard_position):
-            moves_bitboard = self.get_king_legal_moves(bitboard_position)
-            moves = self.moves_bitboard_to_moves(position, bitboard_position, moves_bitboard)
-            return moves
-         
+            return self.get_king_legal_moves(bitboard_position)
+
         attacks = self.board.attack_tables[bitboard_position]
 
         friendly_piece_color = self.board.get_piece_color(bitboard_position)
 
-        moves_bitboard = attacks & (~self.board.pieces[friendly_piece_color])
-
-        if self.board.player_in_check:
-            moves_blocking_check = self.board.moves_blocking_white_check & self.board.moves_blocking_black_check
-
-            if len(self.board.pieces_attacking_white_king) == 1:
-                moves_blocking_check |= self.board.pieces_attacking_white_king[0]
-            if len(self.board.pieces_attacking_black_king) == 1:
-                moves_blocking_check |= self.board.pieces_attacking_black_king[0]
-
-            moves_bitboard &= moves_blocking_check
-        
-        if self.board.is_pinned(bitboard_position):
-            moves_bitboard &= (self.board.pinned_piece_moves[bitboard_position] | list(self.board.pinning_pieces.keys())[list(self.board.pinning_pieces.values()).index(bitboard_position)])
+        moves_bitboard = attacks & ~self.board.pieces[friendly_piece_color] & self.board.check_mask
         
-        moves_list = self.moves_bitboard_to_moves(position, bitboard_position, moves_bitboard)
+        if self.board.pinned_pieces & bitboard_position:
+            moves_bitboard &= LINE[self.get_king_position()][position]
 
-        return moves_list
+        return moves_bitboard
    
     def get_pawn_legal_moves(self, position, bitboard_position):
         if self.board.is_white(bitboard_position):
             moves = bitboard_position >> 8 & ~(self.board.pieces[pieces.WHITE] | self.board.pieces[pieces.BLACK])
 
-            moves |= self.board.attack_tables[bitboard_position] & (self.board.pieces[pieces.BLACK] | self.board.en_passant_target)
+            moves |= self.board.attack_tables[bitboard_position] & self.board.pieces[pieces.BLACK]
             
             # Allow Two Squares If First Move
-            if 0b1000000000000000000000000000000000000000000000000 <= bitboard_position <= 0b10000000000000000000000000000000000000000000000000000000 and bitboard_position >> 8 & ~(self.board.pieces[pieces.WHITE] | self.board.pieces[pieces.BLACK]):
+            if bitboard_position & WHITE_PAWN_START_RANK and bitboard_position >> 8 & ~(self.board.pieces[pieces.WHITE] | self.board.pieces[pieces.BLACK]):
                 moves |= bitboard_position >> 16 & ~(self.board.pieces[pieces.WHITE] | self.board.pieces[pieces.BLACK])
-            
-            if self.board.white_in_check:
-                if len(self.board.pieces_attacking_white_king) == 1:
-                    moves &= self.board.moves_blocking_white_check | self.board.pieces_attacking_white_king[0]
-                else:
-                    moves &= self.board.moves_blocking_white_check
+
         else:
             moves = bitboard_position << 8 & ~(self.board.pieces[pieces.WHITE] | self.board.pieces[pieces.BLACK])
 
-            moves |= self.board.attack_tables[bitboard_position] & (self.board.pieces[pieces.WHITE] | self.board.en_passant_target)
+            moves |= self.board.attack_tables[bitboard_position] & self.board.pieces[pieces.WHITE]
             
             # Allow Two Squares If First Move
-            if 0b100000000 <= bitboard_position <= 0b1000000000000000 and bitboard_position << 8 & ~(self.board.pieces[pieces.WHITE] | self.board.pieces[pieces.BLACK]):
+            if bitboard_position & BLACK_PAWN_START_RANK and bitboard_position << 8 & ~(self.board.pieces[pieces.WHITE] | self.board.pieces[pieces.BLACK]):
                 moves |= bitboard_position << 16 & ~(self.board.pieces[pieces.WHITE] | self.board.pieces[pieces.BLACK])
-            
-            if self.board.black_in_check:
-                if len(self.board.pieces_attacking_black_king) == 1:
-                    moves &= self.board.moves_blocking_black_check | self.board.pieces_attacking_black_king[0]
-                else:
-                    moves &= self.board.moves_blocking_black_check
 
-        if self.board.is_pinned(bitboard_position):
-            moves &= (self.board.pinned_piece_moves[bitboard_position] | list(self.board.pinning_pieces.keys())[list(self.board.pinning_pieces.values()).index(bitboard_position)])
+        moves &= self.board.check_mask
+
+        # En passant is checked on its own, it empties two squares so the usual masks don't cover it
+        if self.board.attack_tables[bitboard_position] & self.board.en_passant_target and self.board.is_legal_en_passant(bitboard_position):
+            moves |= self.board.en_passant_target
+
+        if self.board.pinned_pieces & bitboard_position:
+            moves &= LINE[self.get_king_position()][position]
         
         return moves
 
+    def get_king_position(self):
+        friendly_color = pieces.WHITE if self.board.white_to_move else pieces.BLACK
+        return msb(self.board.pieces[friendly_color] & self.board.pieces[pieces.KING])
+
     def get_king_legal_moves(self, bitboard_position):
         attacks = self.board.attack_tables[bitboard_position]
 
@@ -109,10 +409,10 @@ class MoveGenerator:
         else:
             moves_bitboard = attacks & ~(self.board.pieces[pieces.BLACK] | self.board.white_pieces_attack_table)
         
-        white_can_kingside_castle = self.board.white_to_move and self.board.white_can_kingside_castle and not self.board.white_in_check and 0b110000000000000000000000000000000000000000000000000000000000000 & (self.board.pieces[pieces.WHITE] | self.board.pieces[pieces.BLACK] | self.board.black_pieces_attack_table) == 0
-        white_can_queenside_castle = self.board.white_to_move and self.board.white_can_queenside_castle and not self.board.white_in_check and 0b110000000000000000000000000000000000000000000000000000000000 & (self.board.pieces[pieces.WHITE] | self.board.pieces[pieces.BLACK] | self.board.black_pieces_attack_table) == 0
-        black_can_kingside_castle = not self.board.white_to_move and self.board.black_can_kingside_castle and not self.board.black_in_check and 0b1100000 & (self.board.pieces[pieces.WHITE] | self.board.pieces[pieces.BLACK] | self.board.white_pieces_attack_table) == 0
-        black_can_queenside_castle = not self.board.white_to_move and self.board.black_can_queenside_castle and not self.board.black_in_check and 0b1100 & (self.board.pieces[pieces.WHITE] | self.board.pieces[pieces.BLACK] | self.board.white_pieces_attack_table) == 0
+        white_can_kingside_castle = self.board.white_to_move and self.board.castling_rules & WHITE_KINGSIDE_CASTLE and not self.board.white_in_check and 0b110000000000000000000000000000000000000000000000000000000000000 & (self.board.pieces[pieces.WHITE] | self.board.pieces[pieces.BLACK] | self.board.black_pieces_attack_table) == 0
+        white_can_queenside_castle = self.board.white_to_move and self.board.castling_rules & WHITE_QUEENSIDE_CASTLE and not self.board.white_in_check and 0b110000000000000000000000000000000000000000000000000000000000 & self.board.black_pieces_attack_table == 0 and 0b111000000000000000000000000000000000000000000000000000000000 & (self.board.pieces[pieces.WHITE] | self.board.pieces[pieces.BLACK]) == 0
+        black_can_kingside_castle = not self.board.white_to_move and self.board.castling_rules & BLACK_KINGSIDE_CASTLE and not self.board.black_in_check and 0b1100000 & (self.board.pieces[pieces.WHITE] | self.board.pieces[pieces.BLACK] | self.board.white_pieces_attack_table) == 0
+        black_can_queenside_castle = not self.board.white_to_move and self.board.castling_rules & BLACK_QUEENSIDE_CASTLE and not self.board.black_in_check and 0b1100 & self.board.white_pieces_attack_table == 0 and 0b1110 & (self.board.pieces[pieces.WHITE] | self.board.pieces[pieces.BLACK]) == 0
 
         if white_can_kingside_castle:
             moves_bitboard |= 0b100000000000000000000000000000000000000000000000000000000000000
@@ -125,72 +425,34 @@ class MoveGenerator:
         
         return moves_bitboard
 
-    def moves_bitboard_to_moves(self, start_position, start_bitboard_position, moves_bitboard):
-        moves = []
-        
-        for end_position in self.moves_bitboard_to_positions(moves_bitboard):
-            move_data = self.get_move_data(start_bitboard_position, end_position)
-            if self.board.is_pawn(start_bitboard_position) and ((self.board.is_white(start_bitboard_position) and 0 <= end_position <= 7) or (self.board.is_black(start_bitboard_position) and 56 <= end_position <= 63)):
-                # Move is promotion
+    def add_moves(self, start_position, start_bitboard_position, moves_bitboard, moves, count):
+        promotes = self.board.pieces[pieces.PAWN] & start_bitboard_position and moves_bitboard & PROMOTION_RANKS
+
+        for end_position in bitboard_to_positions(moves_bitboard):
+            move = self.get_move_data(start_position, end_position)
+            if promotes:
                 for promotion in range(1, 5):
-                    promotion_move_data = move_data | promotion << 1
-                    moves.append(Move(start_position, end_position, promotion_move_data, self.board.castling_rules, self.board.en_passant_target))
+                    moves[count] = move | promotion << 1
+                    count += 1
             else:
-                move_data = self.get_move_data(start_bitboard_position, end_position)
-                moves.append(Move(start_position, end_position, move_data, self.board.castling_rules, self.board.en_passant_target))
+                moves[count] = move
+                count += 1
         
-        return moves
+        return count
 
-    def moves_bitboard_to_positions(self, moves_bitboard):
-        while moves_bitboard > 0:
-            position = self.ffs(moves_bitboard)
-            yield position
-            moves_bitboard &= ~(2**position)
-   
-    def ffs(self, x):
-        """Returns the index, counting from 0, of the
-        least significant set bit in `x`.
-        """
-        return (x&-x).bit_length()-1
-   
-    def get_move_data(self, start_bitboard_position, end_position):
-        # Bit 1: white or black move
-        # Bits 2-6: capture
-        # Bits 7-8: castling
-        # Bits 9-11: promotion
-        # Bit 12: en passant
+    def get_move_data(self, start_position, end_position):
+        # The whole move but the captured piece comes from the table, see MOVE_TEMPLATES
+        template = MOVE_TEMPLATES[self.board.mailbox[start_position]][start_position][end_position]
 
-        end_bitboard_position = 2**end_position
+        captured_piece = self.board.mailbox[end_position]
+        if captured_piece:
+            return template & ~EN_PASSANT_FLAG | captured_piece << 6
+        return template
 
-        move_data = 0
-        if self.board.white_to_move:
-            move_data |= 0b100000000000
-        
-        capture_data = 0
-        if self.board.is_white(end_bitboard_position): capture_data |= pieces.WHITE
-        elif self.board.is_black(end_bitboard_position): capture_data |= pieces.BLACK
-
-        if capture_data != 0:
-            if self.board.is_pawn(end_bitboard_position): capture_data |= pieces.PAWN
-            elif self.board.is_knight(end_bitboard_position): capture_data |= pieces.KNIGHT
-            elif self.board.is_bishop(end_bitboard_position): capture_data |= pieces.BISHOP
-            elif self.board.is_rook(end_bitboard_position): capture_data |= pieces.ROOK
-            elif self.board.is_queen(end_bitboard_position): capture_data |= pieces.QUEEN
-            else: capture_data |= pieces.KING
-
-            move_data |= capture_data << 6
-        
-        if self.board.is_white(start_bitboard_position) and self.board.is_king(start_bitboard_position) and end_bitboard_position == 0b100000000000000000000000000000000000000000000000000000000000000 and self.board.white_can_kingside_castle:
-            move_data |= 0b100000
-        elif self.board.is_black(start_bitboard_position) and self.board.is_king(start_bitboard_position) and end_bitboard_position == 0b1000000 and self.board.black_can_kingside_castle:
-            move_data |= 0b100000
-        
-        if self.board.is_white(start_bitboard_position) and self.board.is_king(start_bitboard_position) and end_bitboard_position == 0b10000000000000000000000000000000000000000000000000000000000 and self.board.white_can_queenside_castle:
-            move_data |= 0b10000
-        elif self.board.is_black(start_bitboard_position) and self.board.is_king(start_bitboard_position) and end_bitboard_position == 0b100 and self.board.black_can_queenside_castle:
-            move_data |= 0b10000
-        
-        if self.board.is_pawn(start_bitboard_position) and end_bitboard_position == self.board.en_passant_target:
-            move_data |= 1
-        
-        return move_data
\ No newline at end of file
+def pick_move(moves, scores, index, move_count):
+    # Swap the best scored of the remaining moves into index, a cutoff then never pays to sort the rest
+    best_index = max(range(index, move_count), key=scores.__getitem__)
+    move, score = moves[best_index], scores[best_index]
+    moves[best_index], scores[best_index] = moves[index], scores[index]
+    moves[index], scores[index] = move, score
+    return move
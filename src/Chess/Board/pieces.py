@@ -6,4 +6,7 @@ KNIGHT = 0b10
 BISHOP = 0b11
 ROOK = 0b100
 QUEEN = 0b101
-KING = 0b110
\ No newline at end of file
+KING = 0b110
+
+COLOR_MASK = 0b11000
+TYPE_MASK = 0b111
@@ -1,3 +1,6 @@
+from Chess.Board import pieces
+from Chess.Board.move import EN_PASSANT_FLAG, QUEENSIDE_CASTLE_FLAG, KINGSIDE_CASTLE_FLAG, WHITE_TO_MOVE_FLAG, START_POSITION_SHIFT, END_POSITION_SHIFT
+
 DISTANCE_TO_EDGE = [
     [7, 0, 7, 0, 0, 0, 7, 0], [6, 1, 7, 0, 1, 0, 6, 0], [5, 2, 7, 0, 2, 0, 5, 0], [4, 3, 7, 0, 3, 0, 4, 0], [3, 4, 7, 0, 4, 0, 3, 0], [2, 5, 7, 0, 5, 0, 2, 0], [1, 6, 7, 0, 6, 0, 1, 0], [0, 7, 7, 0, 7, 0, 0, 0],
     [7, 0, 6, 1, 0, 1, 6, 0], [6, 1, 6, 1, 1, 1, 6, 1], [5, 2, 6, 1, 2, 1, 5, 1], [4, 3, 6, 1, 3, 1, 4, 1], [3, 4, 6, 1, 4, 1, 3, 1], [2, 5, 6, 1, 5, 1, 2, 1], [1, 6, 6, 1, 6, 1, 1, 1], [0, 7, 6, 1, 6, 0, 0, 1],
@@ -29,4 +32,55 @@ KING_MOVES = [
     [-8, -7, 1, 8, 9], [-9, -8, -7, -1, 1, 7, 8, 9], [-9, -8, -7, -1, 1, 7, 8, 9], [-9, -8, -7, -1, 1, 7, 8, 9], [-9, -8, -7, -1, 1, 7, 8, 9], [-9, -8, -7, -1, 1, 7, 8, 9], [-9, -8, -7, -1, 1, 7, 8, 9], [-9, -8, -1, 7, 8],
     [-8, -7, 1, 8, 9], [-9, -8, -7, -1, 1, 7, 8, 9], [-9, -8, -7, -1, 1, 7, 8, 9], [-9, -8, -7, -1, 1, 7, 8, 9], [-9, -8, -7, -1, 1, 7, 8, 9], [-9, -8, -7, -1, 1, 7, 8, 9], [-9, -8, -7, -1, 1, 7, 8, 9], [-9, -8, -1, 7, 8],
     [-8, -7, 1], [-9, -8, -7, -1, 1], [-9, -8, -7, -1, 1], [-9, -8, -7, -1, 1], [-9, -8, -7, -1, 1], [-9, -8, -7, -1, 1], [-9, -8, -7, -1, 1], [-9, -8, -1]
-]
\ No newline at end of file
+]
+
+# Same direction order as DISTANCE_TO_EDGE, opposite directions are paired so direction ^ 1 reverses it
+DIRECTION_OFFSETS = [ 1, -1, 8, -8, 7, -7, 9, -9 ]
+
+# RAY[direction][square]: every square from square to the edge in direction, excluding square
+RAY = [[sum(1 << (square + offset * i) for i in range(1, DISTANCE_TO_EDGE[square][direction] + 1)) for square in range(64)] for direction, offset in enumerate(DIRECTION_OFFSETS)]
+
+# BETWEEN[square][other_square]: squares strictly between two squares on a shared rank, file or diagonal
+# LINE[square][other_square]: the whole rank, file or diagonal through both squares
+# Both are 0 if the squares don't share a line
+BETWEEN = [[0] * 64 for _ in range(64)]
+LINE = [[0] * 64 for _ in range(64)]
+
+for square in range(64):
+    for direction in range(8):
+        for other_square in range(64):
+            if RAY[direction][square] & 1 << other_square:
+                BETWEEN[square][other_square] = RAY[direction][square] ^ RAY[direction][other_square] ^ 1 << other_square
+                LINE[square][other_square] = RAY[direction][square] | RAY[direction ^ 1][square] | 1 << square
+
+# Leaper attacks as bitboards, for looking up attackers of a square from the square itself
+KNIGHT_ATTACKS = [sum(1 << (square + move) for move in KNIGHT_MOVES[square]) for square in range(64)]
+KING_ATTACKS = [sum(1 << (square + move) for move in KING_MOVES[square]) for square in range(64)]
+WHITE_PAWN_ATTACKS = [(1 << square - 7 if DISTANCE_TO_EDGE[square][0] > 0 and square >= 8 else 0) | (1 << square - 9 if DISTANCE_TO_EDGE[square][1] > 0 and square >= 8 else 0) for square in range(64)]
+BLACK_PAWN_ATTACKS = [(1 << square + 9 if DISTANCE_TO_EDGE[square][0] > 0 and square < 56 else 0) | (1 << square + 7 if DISTANCE_TO_EDGE[square][1] > 0 and square < 56 else 0) for square in range(64)]
+
+# MOVE_TEMPLATES[piece][start][end]: a move with every bit that only depends on which piece goes where filled in, the
+# side to move, both squares and the castling flags. Pawn captures carry the en passant flag, a move onto an occupied
+# square clears it and ORs in the captured piece instead
+MOVE_TEMPLATES = [None] * (pieces.WHITE | pieces.KING + 1)
+
+for color in [ pieces.WHITE, pieces.BLACK ]:
+    for piece_type in range(pieces.PAWN, pieces.KING + 1):
+        piece_templates = []
+        for start in range(64):
+            start_templates = []
+            for end in range(64):
+                template = start << START_POSITION_SHIFT | end << END_POSITION_SHIFT
+                if color == pieces.WHITE:
+                    template |= WHITE_TO_MOVE_FLAG
+
+                if piece_type == pieces.KING and start in (4, 60) and end - start == 2:
+                    template |= KINGSIDE_CASTLE_FLAG
+                elif piece_type == pieces.KING and start in (4, 60) and end - start == -2:
+                    template |= QUEENSIDE_CASTLE_FLAG
+                elif piece_type == pieces.PAWN and (WHITE_PAWN_ATTACKS if color == pieces.WHITE else BLACK_PAWN_ATTACKS)[start] & 1 << end:
+                    template |= EN_PASSANT_FLAG
+
+                start_templates.append(template)
+            piece_templates.append(start_templates)
+        MOVE_TEMPLATES[color | piece_type] = piece_templates
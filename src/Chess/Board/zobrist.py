@@ -0,0 +1,29 @@
+import random
+
+from Chess.Board import pieces
+
+# Zobrist keys are drawn once from a fixed seed, so every Board, process and run hashes
+# a position to the same key and hashes can be shared or saved to disk.
+#
+# The 781 keys are laid out like the Polyglot opening book format: 64 per piece kind in
+# the order black pawn, white pawn, black knight, ... white king with squares counted
+# from a1, then 4 castling keys, 8 en passant file keys and the white to move key. The
+# values themselves are not Polyglot's published array.
+
+ZOBRIST_SEED = 20231018
+
+random_numbers = random.Random(ZOBRIST_SEED)
+RANDOM_64 = [random_numbers.getrandbits(64) for _ in range(781)]
+
+# Indexed by piece (color | type) then by board position, a8 = 0
+ZOBRIST_PIECE_NUMBERS = [None] * 33
+for piece_type in range(1, 7):
+    for color, color_offset in ((pieces.BLACK, 0), (pieces.WHITE, 1)):
+        kind = 2 * (piece_type - 1) + color_offset
+        ZOBRIST_PIECE_NUMBERS[color | piece_type] = [RANDOM_64[64 * kind + (position ^ 56)] for position in range(64)]
+
+# White kingside, white queenside, black kingside, black queenside
+ZOBRIST_CASTLING_NUMBERS = RANDOM_64[768:772]
+# Indexed by file of the en passant target
+ZOBRIST_EN_PASSANT_NUMBERS = RANDOM_64[772:780]
+ZOBRIST_WHITE_TO_MOVE_NUMBER = RANDOM_64[780]
@@ -1,10 +1,12 @@
 import threading, time
 
 START_TIME = 180
+INCREMENT = 0
 
 class Timer:
     def __init__(self):
         self.time = START_TIME
+        self.increment = INCREMENT
         self.timer_stop = threading.Event()
         self.timer_stop.set()
         self.start_time = 0
@@ -21,4 +23,8 @@ class Timer:
             threading.Timer(1, self.tick_timer).start()
     
     def stop_timer(self):
-        self.timer_stop.set()
\ No newline at end of file
+        self.timer_stop.set()
+
+    def end_turn(self):
+        self.stop_timer()
+        self.time += self.increment
\ No newline at end of file
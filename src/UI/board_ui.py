@@ -2,6 +2,7 @@ import pygame
 
 from UI.ui_element import UIElement
 from Chess.Board.move_generator import MoveGenerator
+from Chess.Board.move import Move
 
 chess_board = pygame.image.load("./src/UI/images/chess_board.png")
 
@@ -31,7 +32,7 @@ class BoardUI(UIElement):
         self.board_position = board_position
         screen.blit(chess_board, board_position)
 
-        last_move = board.moves[-1] if len(board.moves) > 0 else None
+        last_move = Move(board.moves[-1]) if len(board.moves) > 0 else None
         if last_move:
             screen.blit(previous_move_overlay, self.get_screen_position_from_square(last_move.start_position))
             screen.blit(previous_move_overlay, self.get_screen_position_from_square(last_move.end_position))
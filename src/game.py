@@ -1,7 +1,7 @@
 from input_handler import InputHandler
 from renderer import Renderer
 from Chess.Board.board import Board
-from Chess.Board.move_generator import MoveGenerator
+from Chess.Board.legal_move_cache import LegalMoveCache
 from Chess.AI.chess_bot import ChessBot
 from Chess.timer import Timer
 
@@ -10,10 +10,11 @@ COMPUTER_IS_WHITE = False
 class Game:
     def __init__(self):
         self.board = Board()
-        self.input_handler = InputHandler()
+        self.legal_move_cache = LegalMoveCache(self.board)
+        self.input_handler = InputHandler(self.legal_move_cache)
         self.renderer = Renderer()
 
-        self.chess_bot = ChessBot(self.board)
+        self.chess_bot = ChessBot(self.board, self.legal_move_cache)
 
         self.white_timer = Timer()
         self.black_timer = Timer()
@@ -27,11 +28,10 @@ class Game:
         self.input_handler.handle_input(pygame_events, self.renderer, self.board, self.chess_bot)
     
     def simulate(self):
-        move_generator = MoveGenerator(self.board)
-        legal_moves = move_generator.get_legal_moves()
+        legal_moves = self.legal_move_cache.get_legal_moves()
 
-        if len(move_generator.get_legal_moves()) == 0:
-            if self.board.previous_positions.count(self.board.zobrist_key) >= 3:
+        if len(legal_moves) == 0:
+            if self.board.is_threefold_repetition:
                 print("Stalemate.")
             elif self.board.player_in_check:
                 print("Checkmate.")
@@ -49,16 +49,16 @@ class Game:
             return
         
         if self.white_to_move == self.computer_is_white:
-            move, evaluation = self.chess_bot.find_move()
+            move, evaluation = self.chess_bot.find_move(self.white_timer if self.computer_is_white else self.black_timer)
             self.board.make_move(move)
             self.board.moves.append(move)  
         
         if self.white_to_move and not self.board.white_to_move:
-            self.white_timer.stop_timer()
+            self.white_timer.end_turn()
             self.black_timer.start_timer()
             self.white_to_move = self.board.white_to_move
         elif not self.white_to_move and self.board.white_to_move:
-            self.black_timer.stop_timer()
+            self.black_timer.end_turn()
             self.white_timer.start_timer()
             self.white_to_move = self.board.white_to_move    
     
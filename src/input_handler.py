@@ -1,25 +1,23 @@
 import pygame
 
-from Chess.Board.move_generator import MoveGenerator
-from Chess.Board.move import Move
+from Chess.Board.move import Move, get_end_position
 from Chess.Board.pre_computed_data import DISTANCE_TO_EDGE
 
 class InputHandler:
-    def __init__(self):
+    def __init__(self, legal_move_cache):
         self.selected_piece = -1
+        self.legal_move_cache = legal_move_cache
     
     def handle_input(self, pygame_events, renderer, board, chess_bot):
-        move_generator = MoveGenerator(board)
-
         for event in pygame_events:
             if event.type == pygame.MOUSEBUTTONDOWN:
-                self.mouse_down(pygame.mouse.get_pos(), renderer, board, move_generator)
+                self.mouse_down(pygame.mouse.get_pos(), renderer, board)
             elif event.type == pygame.MOUSEBUTTONUP:
-                self.mouse_up(pygame.mouse.get_pos(), renderer, board, move_generator)
+                self.mouse_up(pygame.mouse.get_pos(), renderer, board)
             elif event.type == pygame.KEYUP and event.key == pygame.K_u:
                 self.undo_move(board)
   
-    def mouse_down(self, position, renderer, board, move_generator):
+    def mouse_down(self, position, renderer, board):
         clicked_square = renderer.board_ui.get_square_from_screen_position(position)
 
         if clicked_square == -1:
@@ -31,26 +29,24 @@ class InputHandler:
             return
         
         self.selected_piece = clicked_square
-        legal_moves = move_generator.get_piece_legal_moves((clicked_square, board.get_bitboard_position_from_index(clicked_square)))
+        legal_moves = [Move(move) for move in self.legal_move_cache.get_piece_legal_moves(clicked_square)]
         renderer.board_ui.set_selected_piece(clicked_square, legal_moves, board)
 
-    def mouse_up(self, position, renderer, board, move_generator):
+    def mouse_up(self, position, renderer, board):
         released_square = renderer.board_ui.get_square_from_screen_position(position)
 
         if released_square != -1 and self.selected_piece != -1:
-            self.make_move(self.selected_piece, released_square, board, move_generator)
+            self.make_move(self.selected_piece, released_square, board)
 
         self.selected_piece = -1
         renderer.board_ui.set_selected_piece(-1, [], board)
     
-    def make_move(self, start_position, end_position, board, move_generator):
-        start_bitboard_position = board.get_bitboard_position_from_index(start_position)
-
+    def make_move(self, start_position, end_position, board):
         move = None
-        legal_moves = move_generator.get_piece_legal_moves((start_position, start_bitboard_position))
+        legal_moves = self.legal_move_cache.get_piece_legal_moves(start_position)
 
         for legal_move in legal_moves:
-            if legal_move.end_position == end_position:
+            if get_end_position(legal_move) == end_position:
                 move = legal_move
                 break
 
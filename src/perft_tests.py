@@ -6,10 +6,12 @@ from Chess.Board.move_generator import MoveGenerator
 def search(board: Board, depth):
 
     move_generator = MoveGenerator(board)
-    legal_moves = move_generator.get_legal_moves()
 
+    # Leaves are counted in bulk without generating them
     if depth == 1:
-        return len(legal_moves)
+        return move_generator.count_legal_moves()
+
+    legal_moves = move_generator.get_legal_moves()
 
     num_positions = 0
 